@@ -1,15 +1,18 @@
 import sys
 import signal
+import socket
 
 from threading import Thread
 
 from .actions import ActionRegistry
-from .backends import BluetoothBackend, HidrawBackend
-from .servers import UDPServer
+from .backends import BluetoothBackend, HidrawBackend, ReceiverBackend
+from .collector import GCTuner
+from .servers import ForwardServer, SharedMemoryServer, UDPServer
 from .config import load_options
 from .daemon import Daemon
 from .eventloop import EventLoop
 from .exceptions import BackendError
+from .reader import ThreadedReader
 
 
 class DS4Controller(object):
@@ -20,6 +23,9 @@ class DS4Controller(object):
 
         self.error = None
         self.device = None
+        self.reader = None
+        self.last_report = None
+        self.gc_stats = None
         self.loop = EventLoop()
 
         self.actions = [cls(self) for cls in ActionRegistry.actions]
@@ -77,16 +83,35 @@ class DS4Controller(object):
 
         self.device = device
         self.device.set_led(*self.options.led)
+
+        if self.default_profile.report_pool > 0:
+            self.device.set_report_pool(self.default_profile.report_pool)
+
         self.fire_event("device-setup", device)
-        self.loop.add_watcher(device.report_fd, self.read_report)
+
+        if self.default_profile.threaded_reader:
+            self.reader = ThreadedReader(device, self.logger)
+            self.reader.start()
+            self.loop.add_watcher(self.reader.report_fd, self.read_report)
+        else:
+            self.loop.add_watcher(device.report_fd, self.read_report)
+
         self.load_options(self.options)
 
     def cleanup_device(self):
         self.logger.info("Disconnected")
         self.fire_event("device-cleanup")
-        self.loop.remove_watcher(self.device.report_fd)
+
+        if self.reader:
+            self.loop.remove_watcher(self.reader.report_fd)
+            self.reader.close()
+            self.reader = None
+        else:
+            self.loop.remove_watcher(self.device.report_fd)
+
         self.device.close()
         self.device = None
+        self.last_report = None
 
         if self.dynamic:
             self.loop.stop()
@@ -96,7 +121,7 @@ class DS4Controller(object):
         self.options = options
 
     def read_report(self):
-        report = self.device.read_report()
+        report = (self.reader or self.device).read_report()
 
         if not report:
             if report is False:
@@ -105,6 +130,7 @@ class DS4Controller(object):
             self.cleanup_device()
             return
 
+        self.last_report = report
         self.fire_event("device-report", report)
 
     def run(self):
@@ -161,7 +187,10 @@ def main():
     except ValueError as err:
         Daemon.exit("Failed to parse options: {0}", err)
 
-    if options.hidraw:
+    if options.receiver:
+        backend = ReceiverBackend(Daemon.logger, options.receiver_host,
+                                  options.receiver_port)
+    elif options.hidraw:
         backend = HidrawBackend(Daemon.logger)
     else:
         backend = BluetoothBackend(Daemon.logger)
@@ -177,11 +206,45 @@ def main():
     udpserver = None
 
     if options.udp:
-        udpserver = UDPServer(options.udp_host, options.udp_port)
+        try:
+            udpserver = UDPServer(Daemon.logger, options.udp_host,
+                                  options.udp_port, options.udp_workers,
+                                  options.udp_max_clients,
+                                  options.udp_rate_limit)
+        except (ValueError, socket.error) as err:
+            Daemon.exit("Failed to start UDP server: {0}", err)
+
         udpserver.remap = options.udp_remap_buttons
         udpserver.send_touch = not options.udp_no_touch
         udpserver.start()
 
+    forwardserver = None
+
+    if options.forward:
+        try:
+            forwardserver = ForwardServer(Daemon.logger, options.forward,
+                                          options.forward_port,
+                                          options.forward_keyframe_interval)
+        except socket.error as err:
+            Daemon.exit("Failed to start forwarding: {0}", err)
+
+        forwardserver.start()
+
+    shmserver = None
+
+    if options.shm:
+        shmserver = SharedMemoryServer(Daemon.logger, options.shm_path,
+                                       options.shm_slots, options.shm_raw)
+
+    gctuner = None
+
+    if options.gc_freeze or options.gc_threshold or options.gc_idle_collect:
+        try:
+            gctuner = GCTuner(Daemon.logger, options.gc_freeze,
+                              options.gc_threshold, options.gc_idle_collect)
+        except ValueError as err:
+            Daemon.exit("Failed to tune garbage collection: {0}", err)
+
     for index, controller_options in enumerate(options.controllers):
         thread = create_controller_thread(index + 1, controller_options)
         threads.append(thread)
@@ -189,6 +252,21 @@ def main():
         if options.udp:
             udpserver.register_controller(thread.controller)
 
+        if options.forward:
+            forwardserver.register_controller(thread.controller)
+
+        if options.shm:
+            try:
+                shmserver.register_controller(thread.controller)
+            except (OSError, IOError) as err:
+                Daemon.exit("Failed to create shared memory file: {0}", err)
+
+        if gctuner:
+            gctuner.register_controller(thread.controller)
+
+    if gctuner:
+        gctuner.start()
+
     for device in backend.devices:
         connected_devices = []
         for thread in threads:
@@ -216,6 +294,9 @@ def main():
                                               dynamic=True)
             threads.append(thread)
 
+            if gctuner:
+                gctuner.register_controller(thread.controller)
+
         thread.controller.setup_device(device)
 
 if __name__ == "__main__":
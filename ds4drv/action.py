@@ -16,7 +16,13 @@ class ActionRegistry(type):
 
 
 class Action(with_metaclass(ActionRegistry)):
-    """Actions are what drives most of the functionality of ds4drv."""
+    """Actions are what drives most of the functionality of ds4drv.
+
+    Actions listing options in enabled_by are only enabled while one of
+    those options is set, actions without any are always enabled.
+    """
+
+    enabled_by = ()
 
     @classmethod
     def add_option(self, *args, **kwargs):
@@ -25,10 +31,11 @@ class Action(with_metaclass(ActionRegistry)):
     def __init__(self, controller):
         self.controller = controller
         self.logger = controller.logger
+        self.enabled = False
 
         self.register_event("device-setup", self.setup)
         self.register_event("device-cleanup", self.disable)
-        self.register_event("load-options", self.load_options)
+        self.register_event("load-options", self._load_options)
 
     def create_timer(self, interval, func):
         return self.controller.loop.create_timer(interval, func)
@@ -39,6 +46,24 @@ class Action(with_metaclass(ActionRegistry)):
     def unregister_event(self, event, func):
         self.controller.loop.unregister_event(event, func)
 
+    def _load_options(self, options):
+        self.load_options(options)
+
+        enabled = self.is_enabled(options)
+        if enabled != self.enabled:
+            self.enabled = enabled
+            self.update_enabled()
+
+    def is_enabled(self, options):
+        if not self.enabled_by:
+            return True
+
+        return any(getattr(options, name) for name in self.enabled_by)
+
+    def update_enabled(self):
+        """Called when the action is enabled or disabled by options."""
+        pass
+
     def setup(self, device):
         pass
 
@@ -53,24 +78,26 @@ class Action(with_metaclass(ActionRegistry)):
 
 
 class ReportAction(Action):
-    def __init__(self, controller):
-        super(ReportAction, self).__init__(controller)
+    def update_enabled(self):
+        # Only actions that use each report are called for them, the
+        # timers get the controller's last report instead
+        if type(self).handle_report is ReportAction.handle_report:
+            return
 
-        self._last_report = None
-        self.register_event("device-report", self._handle_report)
+        if self.enabled:
+            self.register_event("device-report", self.handle_report)
+        else:
+            self.unregister_event("device-report", self.handle_report)
 
     def create_timer(self, interval, callback):
         @wraps(callback)
         def wrapper(*args, **kwargs):
-            if self._last_report:
-                return callback(self._last_report, *args, **kwargs)
+            report = self.controller.last_report
+            if report:
+                return callback(report, *args, **kwargs)
             return True
 
         return super(ReportAction, self).create_timer(interval, wrapper)
 
-    def _handle_report(self, report):
-        self._last_report = report
-        self.handle_report(report)
-
     def handle_report(self, report):
         pass
@@ -10,6 +10,8 @@ ReportAction.add_option("--battery-flash", action="store_true",
 class ReportActionBattery(ReportAction):
     """Flashes the LED when battery is low."""
 
+    enabled_by = ("battery_flash",)
+
     def __init__(self, *args, **kwargs):
         super(ReportActionBattery, self).__init__(*args, **kwargs)
 
@@ -24,7 +26,7 @@ class ReportActionBattery(ReportAction):
         self.timer_flash.stop()
 
     def load_options(self, options):
-        if options.battery_flash:
+        if self.is_enabled(options):
             self.enable()
         else:
             self.disable()
@@ -1,35 +1,74 @@
-import os
 import re
 import shlex
 import subprocess
 
-from collections import namedtuple
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
+from threading import Lock, Thread
+from time import monotonic
 
 from ..action import ReportAction
-from ..config import buttoncombo
+from ..config import buttoncombo, positiveint
+from ..device import BUTTON_MASKS
 
 ReportAction.add_option("--bindings", metavar="bindings",
                         help="Use custom action bindings specified in the "
                              "config file")
 
+ReportAction.add_option("--binding-concurrency", metavar="N",
+                        type=positiveint, default=1,
+                        help="Number of runs of the same exec or "
+                             "exec-background binding allowed at once. "
+                             "Default is 1")
+
+ReportAction.add_option("--binding-debounce", metavar="seconds",
+                        type=float, default=0.2,
+                        help="Repeated presses of an exec or "
+                             "exec-background binding within this many "
+                             "seconds are ignored. Default is 0.2")
+
 ReportAction.add_option("--profile-toggle", metavar="button(s)",
                         type=buttoncombo("+"),
                         help="A button combo that will trigger profile "
                              "cycling, e.g. 'R1+L1+PS'")
 
 ActionBinding = namedtuple("ActionBinding", "modifiers button callback args")
+BindingAction = namedtuple("BindingAction", "type func pooled args")
+
+VAR_PATTERN = re.compile(r"\$(?P<var>\w+)(\.(?P<attr>\w+))?")
+
+# Actions running commands are executed by this many shared workers
+BINDING_WORKERS = 4
+
+_executor = None
+_executor_lock = Lock()
+
+
+def executor():
+    """Returns the worker pool shared by all controllers."""
+    global _executor
+    with _executor_lock:
+        if not _executor:
+            _executor = ThreadPoolExecutor(max_workers=BINDING_WORKERS)
+
+    return _executor
 
 
 class ReportActionBinding(ReportAction):
     """Listens for button presses and executes actions."""
 
     actions = {}
+    pooled_actions = set()
 
     @classmethod
-    def action(cls, name):
+    def action(cls, name, pooled=False):
+        """Registers a action, pooled actions are run by the worker pool
+        instead of blocking the controller."""
         def decorator(func):
             cls.actions[name] = func
+            if pooled:
+                cls.pooled_actions.add(name)
             return func
 
         return decorator
@@ -39,6 +78,13 @@ class ReportActionBinding(ReportAction):
 
         self.bindings = []
         self.active = set()
+        self.compile_bindings()
+
+        self.lock = Lock()
+        self.running = defaultdict(int)
+        self.last_run = {}
+        self.concurrency = 1
+        self.debounce = 0
 
     def add_binding(self, combo, callback, *args):
         modifiers, button = combo[:-1], combo[-1]
@@ -48,12 +94,16 @@ class ReportActionBinding(ReportAction):
     def load_options(self, options):
         self.active = set()
         self.bindings = []
+        self.concurrency = options.binding_concurrency
+        self.debounce = options.binding_debounce
 
         bindings = (self.controller.bindings["global"].items(),
                     self.controller.bindings.get(options.bindings, {}).items())
 
         for binding, action in chain(*bindings):
-            self.add_binding(binding, self.handle_binding_action, action)
+            action = self.compile_action(action)
+            if action:
+                self.add_binding(binding, self.handle_binding_action, action)
 
         have_profiles = (self.controller.profiles and
                          len(self.controller.profiles) > 1)
@@ -61,6 +111,53 @@ class ReportActionBinding(ReportAction):
             self.add_binding(self.controller.default_profile.profile_toggle,
                              lambda r: self.controller.next_profile())
 
+        self.compile_bindings()
+
+    def is_enabled(self, options):
+        return bool(self.bindings)
+
+    def compile_bindings(self):
+        """Compiles the bindings into masks over the report's packed
+        buttons, see BUTTON_MASKS."""
+        buttons = set()
+        for binding in self.bindings:
+            buttons.update(binding.modifiers)
+            buttons.add(binding.button)
+
+        self.word_mask = sum(BUTTON_MASKS[button] for button in buttons)
+
+        self.matchers = tuple(
+            (sum(BUTTON_MASKS[button] for button in
+                 set(binding.modifiers) | set([binding.button])),
+             BUTTON_MASKS[binding.button], binding)
+            for binding in self.bindings
+        )
+        self.button_word = 0
+
+    def compile_action(self, action):
+        """Splits a action into its type and argument templates."""
+        try:
+            action_split = shlex.split(action)
+        except ValueError as err:
+            self.logger.error("Invalid action '{0}': {1}", action, err)
+            return
+
+        if not action_split:
+            return
+
+        action_type = action_split[0]
+        func = self.actions.get(action_type)
+        if not func:
+            self.logger.error("Invalid action type: {0}", action_type)
+            return
+
+        # Only arguments with variables need to be processed when run
+        args = tuple((arg, bool(VAR_PATTERN.search(arg)))
+                     for arg in action_split[1:])
+
+        return BindingAction(action_type, func,
+                             action_type in self.pooled_actions, args)
+
     def handle_binding_action(self, report, action):
         info = dict(name=self.controller.device.name,
                     profile=self.controller.current_profile,
@@ -74,40 +171,66 @@ class ReportActionBinding(ReportAction):
                 var = getattr(var, attr, None)
             return str(var)
 
-        action = re.sub(r"\$(?P<var>\w+)(\.(?P<attr>\w+))?",
-                        replace_var, action)
-        action_split = shlex.split(action)
-        action_type = action_split[0]
-        action_args = action_split[1:]
+        args = [VAR_PATTERN.sub(replace_var, arg) if has_vars else arg
+                for arg, has_vars in action.args]
 
-        func = self.actions.get(action_type)
-        if func:
-            try:
-                func(self.controller, *action_args)
-            except Exception as err:
-                self.logger.error("Failed to execute action: {0}", err)
-        else:
-            self.logger.error("Invalid action type: {0}", action_type)
+        if not action.pooled:
+            self.run_action(action, args)
+            return
+
+        now = monotonic()
+        last_run = self.last_run.get(action)
+        if last_run is not None and now - last_run < self.debounce:
+            return
+
+        with self.lock:
+            if self.running[action] >= self.concurrency:
+                self.logger.warning("Not executing {0}, it is still running",
+                                    action.type)
+                return
+
+            self.running[action] += 1
+
+        self.last_run[action] = now
+        executor().submit(self.run_pooled_action, action, args)
+
+    def run_action(self, action, args):
+        try:
+            action.func(self.controller, *args)
+        except Exception as err:
+            self.logger.error("Failed to execute action: {0}", err)
+
+    def run_pooled_action(self, action, args):
+        try:
+            self.run_action(action, args)
+        finally:
+            with self.lock:
+                self.running[action] -= 1
 
     def handle_report(self, report):
-        for binding in self.bindings:
-            modifiers = True
-            for button in binding.modifiers:
-                modifiers = modifiers and getattr(report, button)
+        if not self.matchers:
+            return
+
+        word = report.buttons & self.word_mask
+        changed = word ^ self.button_word
+        if not changed:
+            return
 
-            active = getattr(report, binding.button)
-            released = not active
+        self.button_word = word
+        for mask, button, binding in self.matchers:
+            if not changed & mask:
+                continue
 
-            if modifiers and active and binding not in self.active:
+            if word & mask == mask:
                 self.active.add(binding)
-            elif released and binding in self.active:
+            elif not word & button and binding in self.active:
                 self.active.remove(binding)
                 binding.callback(report, *binding.args)
 
 
-@ReportActionBinding.action("exec")
+@ReportActionBinding.action("exec", pooled=True)
 def exec_(controller, cmd, *args):
-    """Executes a subprocess in the foreground, blocking until returned."""
+    """Executes a subprocess, a worker waits until it has returned."""
     controller.logger.info("Executing: {0} {1}", cmd, " ".join(args))
 
     try:
@@ -116,18 +239,29 @@ def exec_(controller, cmd, *args):
         controller.logger.error("Failed to execute process: {0}", err)
 
 
-@ReportActionBinding.action("exec-background")
+@ReportActionBinding.action("exec-background", pooled=True)
 def exec_background(controller, cmd, *args):
     """Executes a subprocess in the background."""
     controller.logger.info("Executing in the background: {0} {1}",
                            cmd, " ".join(args))
 
     try:
-        subprocess.Popen([cmd] + list(args),
-                         stdout=open(os.devnull, "wb"),
-                         stderr=open(os.devnull, "wb"))
+        child = subprocess.Popen([cmd] + list(args),
+                                 stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL)
     except OSError as err:
         controller.logger.error("Failed to execute process: {0}", err)
+    else:
+        # Reaped as soon as it exits, so it never lingers as a zombie
+        waiter = Thread(target=child.wait)
+        waiter.daemon = True
+        waiter.start()
+
+
+@ReportActionBinding.action("macro")
+def macro(controller, name):
+    """Plays the specified macro."""
+    controller.fire_event("play-macro", name)
 
 
 @ReportActionBinding.action("next-profile")
@@ -19,6 +19,10 @@ class ReportActionBTSignal(ReportAction):
         else:
             self.disable()
 
+    def is_enabled(self, options):
+        device = self.controller.device
+        return device is not None and device.type == "bluetooth"
+
     def enable(self):
         self.timer_check.start()
 
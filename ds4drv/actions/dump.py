@@ -7,8 +7,13 @@ ReportAction.add_option("--dump-reports", action="store_true",
 class ReportActionDump(ReportAction):
     """Pretty prints the reports to the log."""
 
+    enabled_by = ("dump_reports",)
+
     def __init__(self, *args, **kwargs):
         super(ReportActionDump, self).__init__(*args, **kwargs)
+
+        # Dumps are logged 50 times a second, far beyond the budget
+        self.logger = self.logger.unlimited()
         self.timer = self.create_timer(0.02, self.dump)
 
     def enable(self):
@@ -18,7 +23,7 @@ class ReportActionDump(ReportAction):
         self.timer.stop()
 
     def load_options(self, options):
-        if options.dump_reports:
+        if self.is_enabled(options):
             self.enable()
         else:
             self.disable()
@@ -1,7 +1,16 @@
+from functools import partial
+from time import monotonic
+
 from ..action import ReportAction
 from ..config import buttoncombo
+from ..device import AXIS_NAMES, BUTTON_MASKS
 from ..exceptions import DeviceError
-from ..uinput import create_uinput_device
+from ..uinput import (MOUSE_INTERVAL, NullSink, RecordingSink, UInputSink,
+                      create_uinput_device)
+
+# Longest time a stick is assumed to have been held between two mouse
+# updates, protects against jumps after the controller stalls
+MOUSE_ELAPSED_MAX = 0.05
 
 ReportAction.add_option("--emulate-xboxdrv", action="store_true",
                          help="Emulates the same joystick layout as a "
@@ -21,8 +30,78 @@ ReportAction.add_option("--ignored-buttons", metavar="button(s)",
 ReportAction.add_option("--mapping", metavar="mapping",
                         help="Use a custom button mapping specified in the "
                              "config file")
+ReportAction.add_option("--motion-device", action="store_true",
+                        help="Creates a separate motion sensor device "
+                             "with the accelerometer and gyroscope")
+ReportAction.add_option("--mouse-on-report", action="store_true",
+                        help="Updates the mouse as soon as a report arrives "
+                             "instead of every 5 ms, a timer is then only "
+                             "used while a stick is moved or a scroll "
+                             "button is held")
+ReportAction.add_option("--no-uinput", action="store_true",
+                        help="Creates no input devices, e.g. when the "
+                             "controller is only used through the UDP or "
+                             "shared memory servers")
 ReportAction.add_option("--trackpad-mouse", action="store_true",
                         help="Makes the trackpad control the mouse")
+ReportAction.add_option("--trackpad-multitouch", action="store_true",
+                        help="Creates a multitouch touchpad device from the "
+                             "trackpad, which leaves pointer acceleration "
+                             "and gestures to libinput")
+ReportAction.add_option("--uinput-record", metavar="prefix",
+                        default="ds4drv",
+                        help="File name prefix of recordings made with "
+                             "'--uinput-sink record', each device is "
+                             "recorded to <prefix>-<controller>-<mapping>.rec. "
+                             "Default is 'ds4drv'")
+ReportAction.add_option("--uinput-sink", metavar="sink", default="uinput",
+                        choices=("uinput", "null", "record"),
+                        help="Where input events are written to: 'uinput' "
+                             "(default) creates real devices, 'null' "
+                             "discards the events and 'record' records "
+                             "them to files, see --uinput-record")
+ReportAction.add_option("--uinput-timestamps", action="store_true",
+                        help="Sends the controller's sensor clock as "
+                             "MSC_TIMESTAMP events with each joystick "
+                             "report")
+ReportAction.add_option("--uinput-pool", action="store_true",
+                        help="Creates a joystick device for every layout "
+                             "used by --profiles up front and keeps them "
+                             "open, which makes switching between profiles "
+                             "with different layouts near instant. Note: "
+                             "all of these devices are visible to games")
+
+
+def overlay_report(report, overlay):
+    """Returns a copy of report with the values of overlay applied."""
+    copy = report.snapshot()
+    for name, value in overlay.items():
+        setattr(copy, name, value)
+
+        # Keep the packed values in line with the attributes
+        mask = BUTTON_MASKS.get(name)
+        if mask and value:
+            copy.buttons |= mask
+        elif mask:
+            copy.buttons &= ~mask
+        elif name in AXIS_NAMES:
+            copy.axes[AXIS_NAMES.index(name)] = value
+
+    return copy
+
+
+def joystick_layout(options):
+    if options.mapping:
+        return options.mapping
+    elif options.emulate_xboxdrv:
+        return "xboxdrv"
+    elif options.emulate_xpad:
+        return "xpad"
+    elif options.emulate_xpad_wireless:
+        return "xpad_wireless"
+    else:
+        return "ds4"
+
 
 class ReportActionInput(ReportAction):
     """Creates virtual input devices via uinput."""
@@ -32,88 +111,256 @@ class ReportActionInput(ReportAction):
 
         self.joystick = None
         self.joystick_layout = None
+        self.joysticks = {}
         self.mouse = None
+        self.motion = None
+        self.trackpad = None
+        self.overlay = None
+        self.mouse_on_report = False
+        self.mouse_time = None
+        self.timer_running = False
 
         # USB has a report frequency of 4 ms while BT is 2 ms, so we
         # use 5 ms between each mouse emit to keep it consistent and to
         # allow for at least one fresh report to be received inbetween
-        self.timer = self.create_timer(0.005, self.emit_mouse)
+        self.timer = self.create_timer(MOUSE_INTERVAL, self.emit_mouse)
+
+        self.register_event("input-overlay", self.set_overlay)
 
     def setup(self, device):
-        self.timer.start()
+        self.mouse_time = None
+        self.update_timer()
 
-    def disable(self):
+    def start_timer(self):
+        if not self.timer_running:
+            self.timer.start()
+            self.timer_running = True
+
+    def stop_timer(self):
         self.timer.stop()
+        self.timer_running = False
+
+    def update_timer(self):
+        """Runs the mouse timer only while a device has mouse codes."""
+        mouse = self.mouse or (self.joystick and self.joystick.layout.mouse)
+        if mouse and not self.mouse_on_report and self.controller.device:
+            self.start_timer()
+        else:
+            self.stop_timer()
+
+    def is_enabled(self, options):
+        return not options.no_uinput
+
+    def disable(self):
+        self.stop_timer()
 
         if self.joystick:
             self.joystick.emit_reset()
+            self.logger.info("Joystick events written: {0}, suppressed by "
+                             "hysteresis: {1}", self.joystick.events_written,
+                             self.joystick.events_suppressed)
 
         if self.mouse:
             self.mouse.emit_reset()
 
+        if self.motion:
+            self.motion.emit_reset()
+
+        if self.trackpad:
+            self.trackpad.emit_reset()
+
+    def close_devices(self):
+        self.disable()
+
+        for device in set(self.joysticks.values()) | set([self.joystick]):
+            if device:
+                device.close()
+
+        for device in (self.mouse, self.motion, self.trackpad):
+            if device:
+                device.close()
+
+        self.joystick = self.joystick_layout = None
+        self.joysticks = {}
+        self.mouse = self.motion = self.trackpad = None
+
     def load_options(self, options):
+        self.mouse_on_report = options.mouse_on_report
+
+        if not self.is_enabled(options):
+            self.close_devices()
+            return
+
         try:
-            if options.mapping:
-                joystick_layout = options.mapping
-            elif options.emulate_xboxdrv:
-                joystick_layout = "xboxdrv"
-            elif options.emulate_xpad:
-                joystick_layout = "xpad"
-            elif options.emulate_xpad_wireless:
-                joystick_layout = "xpad_wireless"
-            else:
-                joystick_layout = "ds4"
+            layout = joystick_layout(options)
 
             if not self.mouse and options.trackpad_mouse:
-                self.mouse = create_uinput_device("mouse")
+                self.mouse = self.create_device("mouse")
             elif self.mouse and not options.trackpad_mouse:
-                self.mouse.device.close()
+                self.mouse.close()
                 self.mouse = None
 
-            if self.joystick and self.joystick_layout != joystick_layout:
-                self.joystick.device.close()
-                joystick = create_uinput_device(joystick_layout)
-                self.joystick = joystick
+            if not self.motion and options.motion_device:
+                # Sensor fusion needs the sample times, always send them
+                self.motion = self.create_device("ds4_motion",
+                                                 timestamps=True)
+            elif self.motion and not options.motion_device:
+                self.motion.close()
+                self.motion = None
+
+            if not self.trackpad and options.trackpad_multitouch:
+                self.trackpad = self.create_device("ds4_trackpad")
+            elif self.trackpad and not options.trackpad_multitouch:
+                self.trackpad.close()
+                self.trackpad = None
+
+            if self.controller.default_profile.uinput_pool:
+                self.switch_joystick(layout)
+            elif self.joystick and self.joystick_layout != layout:
+                self.joystick.close()
+                self.joystick = self.create_joystick(layout)
+                self.joystick_layout = layout
             elif not self.joystick:
-                joystick = create_uinput_device(joystick_layout)
-                self.joystick = joystick
-                if joystick.device.device:
-                    self.logger.info("Created devices {0} (joystick) "
-                                     "{1} (evdev) ", joystick.joystick_dev,
-                                     joystick.device.device.fn)
-            else:
-                joystick = None
+                self.joystick = self.create_joystick(layout)
+                self.joystick_layout = layout
+
+            ignored_buttons = set(options.ignored_buttons)
 
-            self.joystick.ignored_buttons = set()
-            for button in options.ignored_buttons:
-                self.joystick.ignored_buttons.add(button)
+            # If the profile binding is a single button we don't want to
+            # send it to the joystick at all
+            if (self.controller.profiles and
+                self.controller.default_profile.profile_toggle and
+                len(self.controller.default_profile.profile_toggle) == 1):
 
-            if joystick:
-                self.joystick_layout = joystick_layout
+                button = self.controller.default_profile.profile_toggle[0]
+                ignored_buttons.add(button)
 
-                # If the profile binding is a single button we don't want to
-                # send it to the joystick at all
-                if (self.controller.profiles and
-                    self.controller.default_profile.profile_toggle and
-                    len(self.controller.default_profile.profile_toggle) == 1):
+            # Assigned at once since changing it recompiles the emit plan
+            self.joystick.ignored_buttons = ignored_buttons
 
-                    button = self.controller.default_profile.profile_toggle[0]
-                    self.joystick.ignored_buttons.add(button)
+            self.update_timer()
         except DeviceError as err:
             self.controller.exit("Failed to create input device: {0}", err)
 
+    def create_device(self, mapping, timestamps=False):
+        options = self.controller.default_profile
+        if options.uinput_sink == "null":
+            sink = NullSink
+        elif options.uinput_sink == "record":
+            path = "{0}-{1}-{2}.rec".format(options.uinput_record,
+                                            self.controller.index, mapping)
+            sink = partial(RecordingSink, path)
+        else:
+            sink = UInputSink
+
+        return create_uinput_device(mapping, timestamps, sink)
+
+    def create_joystick(self, layout):
+        timestamps = self.controller.default_profile.uinput_timestamps
+        joystick = self.create_device(layout, timestamps)
+        if joystick.evdev_path:
+            self.logger.info("Created devices {0} (joystick) "
+                             "{1} (evdev) ", joystick.joystick_dev,
+                             joystick.evdev_path)
+
+        return joystick
+
+    def fill_pool(self):
+        """Creates a joystick device for each layout used by a profile."""
+        for profile in self.controller.profiles or ["default"]:
+            options = self.controller.profile_options.get(profile)
+            if not options:
+                continue
+
+            layout = joystick_layout(options)
+            if layout not in self.joysticks:
+                self.joysticks[layout] = self.create_joystick(layout)
+
+    def switch_joystick(self, layout):
+        """Points the input at the pooled joystick device of a layout."""
+        start = monotonic()
+
+        if not self.joysticks:
+            self.fill_pool()
+
+        joystick = self.joysticks.get(layout)
+        if not joystick:
+            joystick = self.joysticks[layout] = self.create_joystick(layout)
+
+        if joystick is self.joystick:
+            return
+
+        # Release everything held on the device we switch away from
+        if self.joystick:
+            self.joystick.emit_reset()
+
+        self.joystick = joystick
+        self.joystick_layout = layout
+        self.logger.info("Switched to {0} layout in {1:.2f} ms", layout,
+                         (monotonic() - start) * 1000)
+
     def emit_mouse(self, report):
+        if not self.mouse_on_report:
+            elapsed = MOUSE_INTERVAL
+        else:
+            now = monotonic()
+            if self.mouse_time is None:
+                elapsed = MOUSE_INTERVAL
+            else:
+                elapsed = min(now - self.mouse_time, MOUSE_ELAPSED_MAX)
+            self.mouse_time = now
+
+        pending = False
         if self.joystick:
-            self.joystick.emit_mouse(report)
+            pending = self.joystick.emit_mouse(report, elapsed)
 
         if self.mouse:
-            self.mouse.emit_mouse(report)
+            pending = self.mouse.emit_mouse(report, elapsed) or pending
+
+        if self.mouse_on_report and not pending:
+            # Idle sticks, the next movement starts a new interval
+            self.mouse_time = None
+            self.timer_running = False
+            return False
 
         return True
 
+    def set_overlay(self, overlay):
+        """Sets values to replace in reports, e.g. by turbo and macros.
+
+        Written right away so timing doesn't depend on the next report.
+        """
+        self.overlay = overlay
+
+        report = self.controller.last_report
+        if not report:
+            return
+
+        if overlay:
+            report = overlay_report(report, overlay)
+
+        if self.joystick:
+            self.joystick.emit(report)
+
+        if self.mouse:
+            self.mouse.emit(report)
+
     def handle_report(self, report):
+        if self.overlay:
+            report = overlay_report(report, self.overlay)
+
         if self.joystick:
             self.joystick.emit(report)
 
         if self.mouse:
             self.mouse.emit(report)
+
+        if self.motion:
+            self.motion.emit(report)
+
+        if self.trackpad:
+            self.trackpad.emit(report)
+
+        if self.mouse_on_report and self.emit_mouse(report):
+            # Keep the mouse moving if the next report is late
+            self.start_timer()
@@ -0,0 +1,129 @@
+from time import monotonic
+
+from ..action import ReportAction
+from ..config import buttoncombo
+
+ReportAction.add_option("--turbo", metavar="button(s)",
+                        type=buttoncombo(","), default=[],
+                        help="A comma-separated list of buttons that fire "
+                             "repeatedly while held, e.g. 'cross,square'")
+ReportAction.add_option("--turbo-rate", metavar="Hz", type=float, default=10,
+                        help="Presses per second of turbo buttons. "
+                             "Default is 10")
+
+
+class ReportActionMacro(ReportAction):
+    """Plays turbo buttons and macros on top of the controller's input.
+
+    The buttons and axes to change are sent to the input action as an
+    overlay with the input-overlay event whenever they change.
+    """
+
+    enabled_by = ("turbo",)
+
+    def __init__(self, *args, **kwargs):
+        super(ReportActionMacro, self).__init__(*args, **kwargs)
+
+        self.macros = {}
+        self.turbo = ()
+        self.turbo_held = ()
+        self.turbo_pressed = False
+        self.turbo_state = {}
+
+        self.macro = None
+        self.macro_state = {}
+
+        self.turbo_timer = self.create_timer(0.05, self.toggle_turbo)
+        self.macro_timer = self.create_timer(0, self.play_step)
+
+        self.register_event("play-macro", self.play_macro)
+
+    def load_options(self, options):
+        self.macros = options.parent.macros
+        self.turbo = tuple(options.turbo)
+        self.turbo_timer.interval = 1.0 / (2 * max(options.turbo_rate, 0.1))
+        self.stop_turbo()
+
+    def disable(self):
+        self.stop_turbo()
+        self.stop_macro()
+
+    def send_overlay(self):
+        overlay = dict(self.turbo_state)
+        overlay.update(self.macro_state)
+        self.controller.fire_event("input-overlay", overlay or None)
+
+    def handle_report(self, report):
+        if not self.turbo:
+            return
+
+        held = tuple(button for button in self.turbo
+                     if getattr(report, button))
+        if held == self.turbo_held:
+            return
+
+        self.turbo_held = held
+        if held:
+            if not self.turbo_state:
+                self.turbo_pressed = True
+                self.turbo_timer.start()
+
+            self.turbo_state = dict((button, self.turbo_pressed)
+                                    for button in held)
+            self.send_overlay()
+        else:
+            self.stop_turbo()
+
+    def toggle_turbo(self, report):
+        self.turbo_pressed = not self.turbo_pressed
+        self.turbo_state = dict((button, self.turbo_pressed)
+                                for button in self.turbo_held)
+        self.send_overlay()
+
+        return True
+
+    def stop_turbo(self):
+        self.turbo_timer.stop()
+        self.turbo_held = ()
+
+        if self.turbo_state:
+            self.turbo_state = {}
+            self.send_overlay()
+
+    def play_macro(self, name):
+        steps = self.macros.get(name)
+        if not steps:
+            self.logger.warning("Ignoring invalid macro: {0}", name)
+            return
+
+        self.logger.info("Playing macro: {0}", name)
+        self.macro = (steps, monotonic())
+        self.play_step(None, 0)
+
+    def play_step(self, report, index):
+        steps, start = self.macro
+        now = monotonic()
+
+        # Steps are timed from the start of the macro so delays in
+        # handling one step don't add up
+        time, state = steps[index]
+        if start + time > now:
+            self.macro_timer.schedule(start + time - now, index)
+            return
+
+        self.macro_state = state
+        self.send_overlay()
+
+        if index + 1 < len(steps):
+            next_time = steps[index + 1][0]
+            self.macro_timer.schedule(start + next_time - now, index + 1)
+        else:
+            self.stop_macro()
+
+    def stop_macro(self):
+        self.macro_timer.stop()
+        self.macro = None
+
+        if self.macro_state:
+            self.macro_state = {}
+            self.send_overlay()
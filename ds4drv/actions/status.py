@@ -18,9 +18,13 @@ class ReportActionStatus(ReportAction):
     def disable(self):
         self.timer.stop()
 
+        if self.controller.gc_stats:
+            self.logger.info("Garbage collection: {0}",
+                             self.controller.gc_stats)
+
     def check_status(self, report):
         if not self.report:
-            self.report = report
+            self.report = report.snapshot()
             show_battery = True
         else:
             show_battery = False
@@ -57,6 +61,7 @@ class ReportActionStatus(ReportAction):
 
             self.logger.info("Audio: {0}", plug_audio)
 
-        self.report = report
+        # Reports may be reused by the device
+        self.report = report.snapshot()
 
         return True
@@ -1,2 +1,3 @@
 from .bluetooth import BluetoothBackend
 from .hidraw import HidrawBackend
+from .receiver import ReceiverBackend
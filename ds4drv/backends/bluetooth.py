@@ -44,7 +44,7 @@ class BluetoothDS4Device(DS4Device):
         super(BluetoothDS4Device, self).__init__(addr.upper(), addr,
                                                  "bluetooth")
 
-    def read_report(self):
+    def read_raw_report(self):
         try:
             ret = self.int_sock.recv_into(self.buf)
         except IOError:
@@ -59,9 +59,7 @@ class BluetoothDS4Device(DS4Device):
             return False
 
         # Cut off bluetooth data
-        buf = zero_copy_slice(self.buf, 3)
-
-        return self.parse_report(buf)
+        return zero_copy_slice(self.buf, 3)
 
     def write_report(self, report_id, data):
         hid = bytearray((HIDP_TRANS_SET_REPORT | HIDP_DATA_RTYPE_OUTPUT,
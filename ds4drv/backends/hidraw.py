@@ -33,7 +33,7 @@ class HidrawDS4Device(DS4Device):
 
         super(HidrawDS4Device, self).__init__(name, addr, type)
 
-    def read_report(self):
+    def read_raw_report(self):
         try:
             ret = self.fd.readinto(self.buf)
         except IOError:
@@ -49,11 +49,9 @@ class HidrawDS4Device(DS4Device):
 
         if self.type == "bluetooth":
             # Cut off bluetooth data
-            buf = zero_copy_slice(self.buf, 2)
-        else:
-            buf = self.buf
+            return zero_copy_slice(self.buf, 2)
 
-        return self.parse_report(buf)
+        return self.buf
 
     def read_feature_report(self, report_id, size):
         op = HIDIOCGFEATURE(size + 1)
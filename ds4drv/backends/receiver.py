@@ -0,0 +1,201 @@
+import socket
+
+from collections import OrderedDict
+
+from ..backend import Backend
+from ..device import DS4Device
+from ..exceptions import BackendError
+from ..forwarding import (ACK_KEYFRAME_REQUEST, DELTA_OFFSET,
+                          KEYFRAME_OFFSET, MAX_PACKET_SIZE, PACKET_ACK,
+                          PACKET_BYE, PACKET_DELTA, PACKET_KEYFRAME,
+                          USB_REPORT_SIZE, ZERO_STATE, build_report,
+                          decode_delta, pack_control, unpack_header,
+                          unpack_keyframe_info)
+
+# Acknowledge every Nth packet, keyframes are always acknowledged
+ACK_INTERVAL = 8
+
+# Acknowledged states kept as possible delta bases
+ACKED_STATES = 8
+
+
+class ReceiverDS4Device(DS4Device):
+    """A controller forwarded from another ds4drv instance."""
+
+    def __init__(self, backend, address, index, addr, type):
+        self.backend = backend
+        self.address = address
+        self.index = index
+
+        # Packets are passed from the backend to the controller thread
+        # through a socket pair so the controller's event loop can watch it
+        self.int_sock, self.ext_sock = socket.socketpair(socket.AF_UNIX,
+                                                         socket.SOCK_DGRAM)
+        self.int_sock.setblocking(False)
+        self.ext_sock.setblocking(False)
+        self.report_fd = self.int_sock.fileno()
+
+        self.buf = bytearray(MAX_PACKET_SIZE)
+        self.report_buf = bytearray(USB_REPORT_SIZE)
+        self.closed = False
+
+        self.session = None
+        self.last_seq = 0
+        self.states = OrderedDict()
+        self.received = 0
+        self.lost = 0
+        self.reordered = 0
+        self.dropped = 0
+
+        name = "{0} via {1[0]}".format(addr, address)
+        super(ReceiverDS4Device, self).__init__(name, addr, type)
+
+    def feed(self, packet):
+        """Queues a packet for the controller thread."""
+        try:
+            self.ext_sock.send(packet)
+        except socket.error:
+            # The controller thread is behind, reports are latest-value
+            # so rather drop this one than stall every other controller
+            self.dropped += 1
+
+    def ack(self, seq, flags=0):
+        self.backend.send(self.address, pack_control(PACKET_ACK, self.index,
+                                                     self.session or 0, seq,
+                                                     flags))
+
+    def read_raw_report(self):
+        try:
+            ret = self.int_sock.recv_into(self.buf)
+        except socket.error:
+            return False
+
+        packet = memoryview(self.buf)[:ret]
+        header = unpack_header(packet)
+        if not header:
+            return False
+
+        packet_type, index, session, seq, base_seq = header
+
+        if packet_type == PACKET_BYE:
+            if session == self.session:
+                return None
+
+            return False
+
+        if packet_type == PACKET_KEYFRAME:
+            if session != self.session:
+                # The forwarder restarted its stream
+                self.session = session
+                self.last_seq = 0
+                self.states.clear()
+
+            base = ZERO_STATE
+            offset = KEYFRAME_OFFSET
+        elif packet_type == PACKET_DELTA and session == self.session:
+            base = self.states.get(base_seq)
+            offset = DELTA_OFFSET
+        else:
+            base = None
+
+        if base is None:
+            self.ack(0, ACK_KEYFRAME_REQUEST)
+            return False
+
+        # Reports are latest-value, anything older than what we have is
+        # of no use anymore
+        if seq <= self.last_seq:
+            self.reordered += 1
+            return False
+
+        try:
+            state = decode_delta(packet, offset, base)
+        except IndexError:
+            return False
+
+        self.lost += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.received += 1
+
+        if packet_type == PACKET_KEYFRAME or self.received % ACK_INTERVAL == 0:
+            self.states[seq] = state
+            if len(self.states) > ACKED_STATES:
+                self.states.popitem(last=False)
+
+            self.ack(seq)
+
+        return build_report(state, self.report_buf)
+
+    def close(self):
+        self.closed = True
+        self.int_sock.close()
+        self.ext_sock.close()
+
+
+class ReceiverBackend(Backend):
+    """Receives controllers forwarded by another ds4drv."""
+
+    __name__ = "receiver"
+
+    def __init__(self, manager, host="127.0.0.1", port=26770):
+        super(ReceiverBackend, self).__init__(manager)
+
+        self.host = host
+        self.port = port
+        self.remote_devices = {}
+
+    def setup(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+
+        try:
+            self.sock.bind((self.host, self.port))
+        except socket.error as err:
+            raise BackendError("Failed to listen on {0}:{1}: {2}".format(
+                self.host, self.port, err
+            ))
+
+    def send(self, address, packet):
+        try:
+            self.sock.sendto(packet, address)
+        except socket.error:
+            pass
+
+    @property
+    def devices(self):
+        """Wait for forwarded DS4 devices to appear."""
+        self.logger.info("Waiting for forwarded devices on {0}:{1}",
+                         self.host, self.port)
+
+        while True:
+            packet, address = self.sock.recvfrom(MAX_PACKET_SIZE)
+            header = unpack_header(packet)
+            if not header:
+                continue
+
+            packet_type, index, session, seq, base_seq = header
+            key = (address, index)
+
+            device = self.remote_devices.get(key)
+            if device and device.closed:
+                del self.remote_devices[key]
+                device = None
+
+            if device:
+                device.feed(packet)
+
+                if packet_type == PACKET_BYE:
+                    del self.remote_devices[key]
+            elif packet_type == PACKET_KEYFRAME:
+                addr, type = unpack_keyframe_info(packet)
+                device = ReceiverDS4Device(self, address, index, addr, type)
+                self.remote_devices[key] = device
+                device.feed(packet)
+
+                self.logger.info("Found device {0} forwarded by {1[0]}",
+                                 addr, address)
+                yield device
+            elif packet_type == PACKET_DELTA:
+                # We missed the keyframe, ask for another one
+                self.send(address, pack_control(PACKET_ACK, index, session, 0,
+                                                ACK_KEYFRAME_REQUEST))
@@ -0,0 +1,122 @@
+"""Tuning and pause statistics of Python's garbage collector.
+
+The collector pauses every thread holding the GIL, so a collection
+during play shows up as a hitch on all controllers at once.
+"""
+
+import gc
+
+from threading import Thread
+from time import perf_counter, sleep
+
+# Sticks and triggers lead report.axes, the motion sensors that follow
+# never rest and are left out when looking for input
+INPUT_AXES = 6
+
+# Stick and trigger movement below this is resting jitter, not input
+IDLE_JITTER = 2
+
+
+class GCStats(object):
+    """Records the pause of each garbage collection."""
+
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.pause_total = 0.0
+        self.pause_max = 0.0
+        self.start_time = None
+
+    def callback(self, phase, info):
+        # Collections hold the GIL from start to stop, so callbacks of
+        # different threads never interleave
+        if phase == "start":
+            self.start_time = perf_counter()
+        elif self.start_time is not None:
+            pause = perf_counter() - self.start_time
+            self.start_time = None
+
+            self.collections[info["generation"]] += 1
+            self.pause_total += pause
+            self.pause_max = max(self.pause_max, pause)
+
+    def __str__(self):
+        return ("{0} collections (generation 0: {1[0]}, 1: {1[1]}, "
+                "2: {1[2]}), longest pause {2:.2f} ms, total {3:.2f} ms"
+                .format(sum(self.collections), self.collections,
+                        self.pause_max * 1000, self.pause_total * 1000))
+
+
+class GCTuner(object):
+    """Applies the garbage collection options."""
+
+    def __init__(self, manager, freeze=False, thresholds=None,
+                 idle_collect=0):
+        self.logger = manager.new_module("gc")
+        self.freeze = freeze
+        self.thresholds = thresholds
+        self.idle_collect = idle_collect
+        self.stats = GCStats()
+        self.changes = 0
+
+        if thresholds and not 1 <= len(thresholds) <= 3:
+            raise ValueError("expected one to three thresholds")
+
+    def register_controller(self, controller):
+        # A connected controller streams reports even when put down, so
+        # only changed buttons, sticks and triggers count as use
+        last = [None, ()]
+
+        def handle_report(report):
+            buttons, axes = report.buttons, report.axes
+            if buttons == last[0] and all(
+                abs(value - last_value) <= IDLE_JITTER
+                for value, last_value in zip(axes, last[1])
+            ):
+                return
+
+            # Copied since pooled reports are overwritten
+            last[0], last[1] = buttons, axes[:INPUT_AXES]
+            self.changes += 1
+
+        controller.gc_stats = self.stats
+
+        if self.idle_collect > 0:
+            controller.loop.register_event("device-report", handle_report)
+
+    def _worker(self):
+        changes = self.changes
+        collected = True
+
+        while True:
+            sleep(self.idle_collect)
+
+            if self.changes != changes:
+                changes = self.changes
+                collected = False
+            elif not collected:
+                gc.collect()
+                collected = True
+
+    def start(self):
+        """Tunes the collector, once all startup objects exist."""
+        gc.callbacks.append(self.stats.callback)
+
+        if self.thresholds:
+            gc.set_threshold(*self.thresholds)
+            self.logger.info("Thresholds set to {0}",
+                             ",".join(map(str, gc.get_threshold())))
+
+        if self.freeze:
+            gc.collect()
+
+            if hasattr(gc, "freeze"):
+                gc.freeze()
+                self.logger.info("Froze {0} startup objects",
+                                 gc.get_freeze_count())
+            else:
+                self.logger.warning("Freezing needs Python 3.7 or later")
+
+        if self.idle_collect > 0:
+            self.thread = Thread(target=self._worker)
+            self.thread.daemon = True
+            self.thread.start()
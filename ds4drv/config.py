@@ -13,7 +13,7 @@ from operator import attrgetter
 
 from . import __version__
 from .uinput import parse_uinput_mapping
-from .utils import parse_button_combo
+from .utils import parse_button_combo, parse_macro
 
 
 CONFIG_FILES = ("~/.config/ds4drv.conf", "/etc/ds4drv.conf")
@@ -39,6 +39,30 @@ class SortingHelpFormatter(argparse.HelpFormatter):
         super(SortingHelpFormatter, self).add_arguments(actions)
 
 
+def stringlist(s):
+    return list(filter(None, map(str.strip, s.split(","))))
+
+
+def intlist(s):
+    return [int(value) for value in stringlist(s)]
+
+
+def positiveint(s):
+    value = int(s)
+    if value < 1:
+        raise ValueError
+
+    return value
+
+
+def nonnegativeint(s):
+    value = int(s)
+    if value < 0:
+        raise ValueError
+
+    return value
+
+
 parser = argparse.ArgumentParser(prog="ds4drv",
                                  formatter_class=SortingHelpFormatter)
 parser.add_argument("--version", action="version",
@@ -57,6 +81,18 @@ backendopt.add_argument("--hidraw", action="store_true",
                              "USB and paired bluetooth devices. Note: "
                              "Bluetooth devices does currently not support "
                              "any LED functionality")
+backendopt.add_argument("--receiver", action="store_true",
+                        help="Use controllers forwarded by another ds4drv "
+                             "with --forward instead of local devices")
+backendopt.add_argument("--receiver-host", metavar="IP", default="127.0.0.1",
+                        help="Interface to receive forwarded controllers on. "
+                             "Default is '127.0.0.1'. Note: forwarded "
+                             "packets are not authenticated, anyone able to "
+                             "reach this address can send controller input")
+backendopt.add_argument("--receiver-port", metavar="PORT", type=int,
+                        default=26770,
+                        help="Port to receive forwarded controllers on. "
+                             "Default is 26770")
 
 daemonopt = parser.add_argument_group("daemon options")
 daemonopt.add_argument("--daemon", action="store_true",
@@ -66,17 +102,77 @@ daemonopt.add_argument("--daemon-log", default=DAEMON_LOG_FILE, metavar="file",
 daemonopt.add_argument("--daemon-pid", default=DAEMON_PID_FILE, metavar="file",
                        help="PID file to create in daemon mode")
 
+forwardopt = parser.add_argument_group("forwarding options")
+forwardopt.add_argument("--forward", metavar="host",
+                        help="Forward controllers to a ds4drv running with "
+                             "--receiver on another host")
+forwardopt.add_argument("--forward-keyframe-interval", metavar="N", type=int,
+                        default=250,
+                        help="Number of reports between full state updates "
+                             "sent to the receiver. Default is 250")
+forwardopt.add_argument("--forward-port", metavar="PORT", type=int,
+                        default=26770,
+                        help="Port of the receiving ds4drv. Default is 26770")
+
+gcopt = parser.add_argument_group("garbage collection options")
+gcopt.add_argument("--gc-freeze", action="store_true",
+                   help="Excludes everything created during startup from "
+                        "later garbage collections")
+gcopt.add_argument("--gc-idle-collect", metavar="seconds", type=float,
+                   default=0,
+                   help="Runs a full garbage collection once no "
+                        "buttons, sticks or triggers have changed for "
+                        "this long, so it doesn't pause a controller in "
+                        "use")
+gcopt.add_argument("--gc-threshold", metavar="N[,N,N]", type=intlist,
+                   help="Sets the garbage collection thresholds of each "
+                        "generation, e.g. '5000,20,20'. Pause times are "
+                        "logged when a controller disconnects if any "
+                        "garbage collection option is used")
+
+shmopt = parser.add_argument_group("shared memory options")
+shmopt.add_argument("--shm", action="store_true",
+                    help="Publish controller state to shared memory for "
+                         "other programs on the same machine")
+shmopt.add_argument("--shm-path", metavar="prefix", default="/dev/shm/ds4drv",
+                    help="Path prefix of the shared memory files, the "
+                         "controller number is appended. Default is "
+                         "'/dev/shm/ds4drv'")
+shmopt.add_argument("--shm-raw", action="store_true",
+                    help="Also publish the raw HID reports")
+shmopt.add_argument("--shm-slots", metavar="N", type=positiveint,
+                    default=256,
+                    help="Number of reports kept in each shared memory "
+                         "ring. Default is 256")
+
 udpopt = parser.add_argument_group("UDP server options")
 udpopt.add_argument("--udp", action="store_true",
                     help="Listen for connections from Cemuhook via UDP")
-udpopt.add_argument("--udp-host", metavar="IP", default="127.0.0.1",
-                    help="Interface that will accept UDP connections")
+udpopt.add_argument("--udp-host", metavar="IP(s)", default="127.0.0.1",
+                    type=stringlist,
+                    help="Interfaces that will accept UDP connections, "
+                         "e.g. '127.0.0.1,::1'. Use '::' to listen on "
+                         "both IPv4 and IPv6")
+udpopt.add_argument("--udp-max-clients", metavar="N", type=positiveint,
+                    default=64,
+                    help="Maximum number of registered UDP clients, the "
+                         "least recently active client is dropped when a "
+                         "new one registers on a full server")
 udpopt.add_argument("--udp-no-touch", action="store_true",
                     help="Do not send touchpad touches to UDP clients")
 udpopt.add_argument("--udp-port", metavar="PORT", type=int, default=26760,
                     help="Port that will be listened by the UDP server")
+udpopt.add_argument("--udp-rate-limit", metavar="N", type=nonnegativeint,
+                    default=20,
+                    help="Maximum number of UDP requests per second "
+                         "accepted from a single address, 0 disables the "
+                         "limit")
 udpopt.add_argument("--udp-remap-buttons", action="store_true",
                     help="Swap A-B and X-Y in UDP reports")
+udpopt.add_argument("--udp-workers", metavar="N", type=positiveint,
+                    default=1,
+                    help="Number of sockets and threads per interface "
+                         "handling UDP requests, shared via SO_REUSEPORT")
 
 controllopt = parser.add_argument_group("controller options")
 
@@ -181,10 +277,6 @@ def hexcolor(color):
     return tuple(values)
 
 
-def stringlist(s):
-    return list(filter(None, map(str.strip, s.split(","))))
-
-
 def buttoncombo(sep):
     func = partial(parse_button_combo, sep=sep)
     func.__name__ = "button combo"
@@ -239,6 +331,10 @@ def load_options():
         options.bindings[name] = config.section(section,
                                                 key_type=parse_button_combo)
 
+    options.macros = {}
+    for name, section in config.sections("macro"):
+        options.macros[name] = parse_macro(config.section(section))
+
     for name, section in config.sections("mapping"):
         mapping = config.section(section)
         for key, attr in mapping.items():
@@ -267,4 +363,13 @@ add_controller_option("--profiles", metavar="profiles",
                       help="Profiles to cycle through using the button "
                            "specified by --profile-toggle, e.g. "
                            "'profile1,profile2'")
+add_controller_option("--report-pool", metavar="size", type=int, default=0,
+                      help="Reuses this many report objects instead of "
+                           "allocating one for each report, which saves "
+                           "garbage collection work. Default is 0 (off)")
+add_controller_option("--threaded-reader", action="store_true",
+                      help="Reads reports on a separate thread, so the "
+                           "device is drained even while reports are "
+                           "processed. When processing falls behind only "
+                           "the latest report is kept")
 
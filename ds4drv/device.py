@@ -1,3 +1,5 @@
+from array import array
+from operator import attrgetter
 from struct import Struct
 from sys import version_info as sys_version
 
@@ -12,8 +14,62 @@ class StructHack(Struct):
 
 if sys_version[:3] <= (2, 7, 4):
     S16LE = StructHack("<h")
+    MOTION = StructHack("<6h")
 else:
     S16LE = Struct("<h")
+    MOTION = Struct("<6h")
+
+# Bits of the digital buttons in DS4Report.buttons. The dpad takes the
+# low bits, the rest are where the HID report has them from byte 5 on
+BUTTON_MASKS = {
+    "dpad_up": 1 << 0,
+    "dpad_down": 1 << 1,
+    "dpad_left": 1 << 2,
+    "dpad_right": 1 << 3,
+    "button_square": 1 << 4,
+    "button_cross": 1 << 5,
+    "button_circle": 1 << 6,
+    "button_triangle": 1 << 7,
+    "button_l1": 1 << 8,
+    "button_r1": 1 << 9,
+    "button_l2": 1 << 10,
+    "button_r2": 1 << 11,
+    "button_share": 1 << 12,
+    "button_options": 1 << 13,
+    "button_l3": 1 << 14,
+    "button_r3": 1 << 15,
+    "button_ps": 1 << 16,
+    "button_trackpad": 1 << 17,
+}
+
+# Dpad bits of each hat value, values above 7 mean released
+DPAD_BITS = (1, 1 | 8, 8, 2 | 8, 2, 2 | 4, 4, 1 | 4) + (0,) * 8
+
+# Order of the values in DS4Report.axes
+AXIS_NAMES = ("left_analog_x", "left_analog_y",
+              "right_analog_x", "right_analog_y",
+              "l2_analog", "r2_analog",
+              "motion_y", "motion_x", "motion_z",
+              "orientation_roll", "orientation_yaw", "orientation_pitch")
+ZERO_AXES = (0,) * len(AXIS_NAMES)
+
+# Trackpad packets in a report, a count followed by 9 byte packets
+TOUCH_COUNT_OFFSET = 33
+TOUCH_PACKET_OFFSET = 34
+TOUCH_PACKET_SIZE = 9
+
+# Values of each decoded touch sample: packet timestamp followed by
+# id, active, x and y of both touches
+TOUCH_SAMPLE_FIELDS = ("timestamp",
+                       "touch0_id", "touch0_active", "touch0_x", "touch0_y",
+                       "touch1_id", "touch1_active", "touch1_x", "touch1_y")
+TOUCH_SAMPLE_SIZE = len(TOUCH_SAMPLE_FIELDS)
+
+
+def touch_sample_index(attr):
+    """Returns the index of a trackpad_touch* report attribute within a
+    touch sample."""
+    return TOUCH_SAMPLE_FIELDS.index(attr[len("trackpad_"):])
 
 
 class DS4Report(object):
@@ -59,12 +115,59 @@ class DS4Report(object):
                  "battery",
                  "plug_usb",
                  "plug_audio",
-                 "plug_mic"]
+                 "plug_mic",
+                 "sensor_timestamp",
+                 "touch_samples",
+                 "buttons",
+                 "axes"]
 
     def __init__(self, *args, **kwargs):
         for i, value in enumerate(args):
             setattr(self, self.__slots__[i], value)
 
+    def snapshot(self):
+        """Returns a copy of the report that later reports don't change.
+
+        Reports from a device with a report pool are reused, consumers
+        keeping a report beyond handling it should keep a snapshot.
+        """
+        report = DS4Report(*get_report_values(self))
+        report.touch_samples = array("H", self.touch_samples)
+        report.axes = array("i", self.axes)
+
+        return report
+
+
+get_report_values = attrgetter(*DS4Report.__slots__)
+
+
+# Report fields shared with other processes and their struct codes, used
+# by the shared memory slots and forwarded controller state
+STATE_FIELDS = [
+    ("left_analog_x", "B"), ("left_analog_y", "B"),
+    ("right_analog_x", "B"), ("right_analog_y", "B"),
+    ("l2_analog", "B"), ("r2_analog", "B"),
+    ("dpad_up", "?"), ("dpad_down", "?"),
+    ("dpad_left", "?"), ("dpad_right", "?"),
+    ("button_cross", "?"), ("button_circle", "?"),
+    ("button_square", "?"), ("button_triangle", "?"),
+    ("button_l1", "?"), ("button_l2", "?"), ("button_l3", "?"),
+    ("button_r1", "?"), ("button_r2", "?"), ("button_r3", "?"),
+    ("button_share", "?"), ("button_options", "?"),
+    ("button_trackpad", "?"), ("button_ps", "?"),
+    ("motion_y", "i"), ("motion_x", "i"), ("motion_z", "i"),
+    ("orientation_roll", "i"), ("orientation_yaw", "i"),
+    ("orientation_pitch", "i"),
+    ("trackpad_touch0_id", "B"), ("trackpad_touch0_active", "?"),
+    ("trackpad_touch0_x", "H"), ("trackpad_touch0_y", "H"),
+    ("trackpad_touch1_id", "B"), ("trackpad_touch1_active", "?"),
+    ("trackpad_touch1_x", "H"), ("trackpad_touch1_y", "H"),
+    ("timestamp", "B"), ("battery", "B"),
+    ("plug_usb", "?"), ("plug_audio", "?"), ("plug_mic", "?"),
+    ("sensor_timestamp", "H"),
+]
+STATE_NAMES = [name for name, code in STATE_FIELDS]
+
 
 class DS4Device(object):
     """A DS4 controller object.
@@ -81,6 +184,13 @@ class DS4Device(object):
         self._led_flash = (0, 0)
         self._led_flashing = False
 
+        self.report_pool = None
+        self.report_index = 0
+
+        # The HID report parse_report was last given, without any
+        # transport header
+        self.last_raw = None
+
         self.set_operational()
 
     def _control(self, **kwargs):
@@ -147,72 +257,165 @@ class DS4Device(object):
 
         self.write_report(report_id, pkt)
 
-    def parse_report(self, buf):
-        """Parse a buffer containing a HID report."""
-        dpad = buf[5] % 16
-
-        return DS4Report(
-            # Left analog stick
-            buf[1], buf[2],
-
-            # Right analog stick
-            buf[3], buf[4],
-
-            # L2 and R2 analog
-            buf[8], buf[9],
-
-            # DPad up, down, left, right
-            (dpad in (0, 1, 7)), (dpad in (3, 4, 5)),
-            (dpad in (5, 6, 7)), (dpad in (1, 2, 3)),
-
-            # Buttons cross, circle, square, triangle
-            (buf[5] & 32) != 0, (buf[5] & 64) != 0,
-            (buf[5] & 16) != 0, (buf[5] & 128) != 0,
+    def set_report_pool(self, size):
+        """Recycles size reports instead of allocating one per report.
 
-            # L1, L2 and L3 buttons
-            (buf[6] & 1) != 0, (buf[6] & 4) != 0, (buf[6] & 64) != 0,
+        A pooled report is overwritten size reports later, use
+        DS4Report.snapshot to keep one around for longer.
+        """
+        self.report_pool = [DS4Report() for i in range(size)]
+        self.report_index = 0
 
-            # R1, R2,and R3 buttons
-            (buf[6] & 2) != 0, (buf[6] & 8) != 0, (buf[6] & 128) != 0,
+        for report in self.report_pool:
+            report.touch_samples = array("H")
+            report.axes = array("i", ZERO_AXES)
 
-            # Share and option buttons
-            (buf[6] & 16) != 0, (buf[6] & 32) != 0,
-
-            # Trackpad and PS buttons
-            (buf[7] & 2) != 0, (buf[7] & 1) != 0,
-
-            # Acceleration
-            S16LE.unpack_from(buf, 13)[0],
-            S16LE.unpack_from(buf, 15)[0],
-            S16LE.unpack_from(buf, 17)[0],
-
-            # Orientation
-            -(S16LE.unpack_from(buf, 19)[0]),
-            S16LE.unpack_from(buf, 21)[0],
-            S16LE.unpack_from(buf, 23)[0],
-
-            # Trackpad touch 1: id, active, x, y
-            buf[35] & 0x7f, (buf[35] >> 7) == 0,
-            ((buf[37] & 0x0f) << 8) | buf[36],
-            buf[38] << 4 | ((buf[37] & 0xf0) >> 4),
-
-            # Trackpad touch 2: id, active, x, y
-            buf[39] & 0x7f, (buf[39] >> 7) == 0,
-            ((buf[41] & 0x0f) << 8) | buf[40],
-            buf[42] << 4 | ((buf[41] & 0xf0) >> 4),
+    def parse_report(self, buf):
+        """Parse a buffer containing a HID report."""
+        self.last_raw = buf
+
+        pool = self.report_pool
+        if pool:
+            report = pool[self.report_index]
+            self.report_index = (self.report_index + 1) % len(pool)
+            samples = report.touch_samples
+            axes = report.axes
+        else:
+            report = DS4Report()
+            samples = array("H")
+            axes = array("i", ZERO_AXES)
 
-            # Timestamp and battery
-            buf[7] >> 2,
-            buf[30] % 16,
+        dpad = buf[5] % 16
 
-            # External inputs (usb, audio, mic)
-            (buf[30] & 16) != 0, (buf[30] & 32) != 0,
-            (buf[30] & 64) != 0
-        )
+        # Left analog stick
+        report.left_analog_x = buf[1]
+        report.left_analog_y = buf[2]
+
+        # Right analog stick
+        report.right_analog_x = buf[3]
+        report.right_analog_y = buf[4]
+
+        # L2 and R2 analog
+        report.l2_analog = buf[8]
+        report.r2_analog = buf[9]
+
+        # DPad up, down, left, right
+        report.dpad_up = dpad in (0, 1, 7)
+        report.dpad_down = dpad in (3, 4, 5)
+        report.dpad_left = dpad in (5, 6, 7)
+        report.dpad_right = dpad in (1, 2, 3)
+
+        # Buttons cross, circle, square, triangle
+        report.button_cross = (buf[5] & 32) != 0
+        report.button_circle = (buf[5] & 64) != 0
+        report.button_square = (buf[5] & 16) != 0
+        report.button_triangle = (buf[5] & 128) != 0
+
+        # L1, L2 and L3 buttons
+        report.button_l1 = (buf[6] & 1) != 0
+        report.button_l2 = (buf[6] & 4) != 0
+        report.button_l3 = (buf[6] & 64) != 0
+
+        # R1, R2,and R3 buttons
+        report.button_r1 = (buf[6] & 2) != 0
+        report.button_r2 = (buf[6] & 8) != 0
+        report.button_r3 = (buf[6] & 128) != 0
+
+        # Share and option buttons
+        report.button_share = (buf[6] & 16) != 0
+        report.button_options = (buf[6] & 32) != 0
+
+        # Trackpad and PS buttons
+        report.button_trackpad = (buf[7] & 2) != 0
+        report.button_ps = (buf[7] & 1) != 0
+
+        # Acceleration and orientation
+        motion = MOTION.unpack_from(buf, 13)
+        report.motion_y = motion[0]
+        report.motion_x = motion[1]
+        report.motion_z = motion[2]
+        report.orientation_roll = -motion[3]
+        report.orientation_yaw = motion[4]
+        report.orientation_pitch = motion[5]
+
+        # Trackpad touch 1: id, active, x, y
+        report.trackpad_touch0_id = buf[35] & 0x7f
+        report.trackpad_touch0_active = (buf[35] >> 7) == 0
+        report.trackpad_touch0_x = ((buf[37] & 0x0f) << 8) | buf[36]
+        report.trackpad_touch0_y = buf[38] << 4 | ((buf[37] & 0xf0) >> 4)
+
+        # Trackpad touch 2: id, active, x, y
+        report.trackpad_touch1_id = buf[39] & 0x7f
+        report.trackpad_touch1_active = (buf[39] >> 7) == 0
+        report.trackpad_touch1_x = ((buf[41] & 0x0f) << 8) | buf[40]
+        report.trackpad_touch1_y = buf[42] << 4 | ((buf[41] & 0xf0) >> 4)
+
+        # Timestamp and battery
+        report.timestamp = buf[7] >> 2
+        report.battery = buf[30] % 16
+
+        # External inputs (usb, audio, mic)
+        report.plug_usb = (buf[30] & 16) != 0
+        report.plug_audio = (buf[30] & 32) != 0
+        report.plug_mic = (buf[30] & 64) != 0
+
+        # Sensor timestamp, in units of 16/3 microseconds
+        report.sensor_timestamp = buf[11] << 8 | buf[10]
+
+        # Every trackpad packet, oldest first
+        report.touch_samples = self.parse_touch_samples(buf, samples)
+
+        # All digital buttons packed into one integer, see BUTTON_MASKS
+        report.buttons = (DPAD_BITS[dpad] | buf[5] & 0xf0 | buf[6] << 8 |
+                          (buf[7] & 3) << 16)
+
+        # Sticks, triggers and motion in the order of AXIS_NAMES, filled
+        # in place so a pooled report keeps its array
+        axes[0], axes[1], axes[2], axes[3] = buf[1], buf[2], buf[3], buf[4]
+        axes[4], axes[5] = buf[8], buf[9]
+        axes[6], axes[7], axes[8] = motion[0], motion[1], motion[2]
+        axes[9], axes[10], axes[11] = -motion[3], motion[4], motion[5]
+        report.axes = axes
+
+        return report
+
+    def parse_touch_samples(self, buf, samples=None):
+        """Decodes all trackpad packets of a report into a flat array of
+        TOUCH_SAMPLE_SIZE values per packet, reusing samples if given."""
+        count = min(buf[TOUCH_COUNT_OFFSET],
+                    (len(buf) - TOUCH_PACKET_OFFSET) // TOUCH_PACKET_SIZE)
+        if samples is None:
+            samples = array("H")
+        else:
+            del samples[:]
+
+        end = TOUCH_PACKET_OFFSET + count * TOUCH_PACKET_SIZE
+        for offset in range(TOUCH_PACKET_OFFSET, end, TOUCH_PACKET_SIZE):
+            samples.append(buf[offset])
+            for touch in (offset + 1, offset + 5):
+                samples.extend((
+                    buf[touch] & 0x7f, (buf[touch] >> 7) == 0,
+                    ((buf[touch + 2] & 0x0f) << 8) | buf[touch + 1],
+                    buf[touch + 3] << 4 | ((buf[touch + 2] & 0xf0) >> 4)
+                ))
+
+        return samples
+
+    def read_raw_report(self):
+        """Read a HID report without parsing it.
+
+        Returns the report's buffer, None when the device disconnected or
+        False when there was no valid report to read.
+        """
+        pass
 
     def read_report(self):
         """Read and parse a HID report."""
-        pass
+        buf = self.read_raw_report()
+        if not buf:
+            return buf
+
+        return self.parse_report(buf)
 
     def write_report(self, report_id, data):
         """Writes a HID report to the control channel."""
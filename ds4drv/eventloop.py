@@ -15,7 +15,18 @@ class Timer(object):
         self.callback = callback
         self.interval = interval
         self.loop = loop
-        self.timer = timerfd.create(timerfd.CLOCK_MONOTONIC)
+        self.timer = None
+
+    def arm(self, spec, callback):
+        # The timerfd is created on first use, so timers of actions
+        # that are never enabled don't hold a fd
+        if self.timer is None:
+            self.timer = timerfd.create(timerfd.CLOCK_MONOTONIC)
+
+        timerfd.settime(self.timer, 0, spec)
+
+        self.loop.remove_watcher(self.timer)
+        self.loop.add_watcher(self.timer, callback)
 
     def start(self, *args, **kwargs):
         """Starts the timer.
@@ -30,15 +41,28 @@ class Timer(object):
             if not repeat:
                 self.stop()
 
-        spec = timerfd.itimerspec(self.interval, self.interval)
-        timerfd.settime(self.timer, 0, spec)
+        self.arm(timerfd.itimerspec(self.interval, self.interval), callback)
 
-        self.loop.remove_watcher(self.timer)
-        self.loop.add_watcher(self.timer, callback)
+    def schedule(self, delay, *args, **kwargs):
+        """Runs the callback once after delay seconds.
+
+        Replaces any earlier start or schedule of the timer, the callback
+        may schedule the timer again.
+        """
+
+        @wraps(self.callback)
+        def callback():
+            os.read(self.timer, 8)
+            self.stop()
+            self.callback(*args, **kwargs)
+
+        # A zero value would disarm the timer instead
+        self.arm(timerfd.itimerspec(0, max(delay, 0.000001)), callback)
 
     def stop(self):
         """Stops the timer if it's running."""
-        self.loop.remove_watcher(self.timer)
+        if self.timer is not None:
+            self.loop.remove_watcher(self.timer)
 
 
 class EventLoop(object):
@@ -78,11 +102,13 @@ class EventLoop(object):
 
     def register_event(self, event, callback):
         """Registers a handler for an event."""
-        self.event_callbacks[event].add(callback)
+        # The sets are replaced rather than changed, handlers may
+        # register others while the event they handle is processed
+        self.event_callbacks[event] = self.event_callbacks[event] | {callback}
 
     def unregister_event(self, event, callback):
         """Unregisters a event handler."""
-        self.event_callbacks[event].remove(callback)
+        self.event_callbacks[event] = self.event_callbacks[event] - {callback}
 
     def fire_event(self, event, *args, **kwargs):
         """Fires a event."""
@@ -0,0 +1,208 @@
+"""Wire format used to forward controllers between ds4drv instances.
+
+Controller state is a vector of the integer values in STATE_NAMES. Each
+packet encodes the state as a delta against a base state: a varint mask
+of the changed fields followed by the zigzag varint difference of each
+changed field. Keyframes use the all-zero state as base and carry the
+controller's address, deltas use the last state acknowledged by the
+receiver, so a lost packet never makes later packets undecodable.
+"""
+
+import random
+import struct
+
+from .device import S16LE, STATE_NAMES
+
+MAGIC = b"D4F"
+
+PACKET_KEYFRAME = 1
+PACKET_DELTA = 2
+PACKET_ACK = 3
+PACKET_BYE = 4
+
+# Set in the base field of an ACK to ask for a keyframe
+ACK_KEYFRAME_REQUEST = 1
+
+# magic, packet type, controller index, session, sequence, base sequence
+HEADER = struct.Struct("<3sBBHII")
+KEYFRAME_INFO = struct.Struct("<6sB")
+
+DELTA_OFFSET = HEADER.size
+KEYFRAME_OFFSET = HEADER.size + KEYFRAME_INFO.size
+
+DEVICE_TYPES = ["usb", "bluetooth"]
+
+MAX_PACKET_SIZE = 512
+USB_REPORT_SIZE = 64
+
+ZERO_STATE = (0,) * len(STATE_NAMES)
+
+DPAD_HAT = {
+    (True, False, False, False): 0,  # up
+    (True, False, False, True): 1,   # up + right
+    (False, False, False, True): 2,  # right
+    (False, True, False, True): 3,   # down + right
+    (False, True, False, False): 4,  # down
+    (False, True, True, False): 5,   # down + left
+    (False, False, True, False): 6,  # left
+    (True, False, True, False): 7,   # up + left
+}
+
+
+def new_session():
+    return random.randint(1, 0xffff)
+
+
+def write_varint(buf, value):
+    while value > 0x7f:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    buf.append(value)
+
+
+def read_varint(buf, offset):
+    value = shift = 0
+    while True:
+        byte = buf[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+
+        shift += 7
+
+
+def encode_delta(buf, state, base):
+    """Appends the delta of state against base to buf."""
+    mask = 0
+    deltas = []
+    for i, (value, base_value) in enumerate(zip(state, base)):
+        if value != base_value:
+            mask |= 1 << i
+            deltas.append(value - base_value)
+
+    write_varint(buf, mask)
+    for delta in deltas:
+        # Zigzag encoding keeps small negative deltas small
+        write_varint(buf, (delta << 1) ^ (delta >> 63))
+
+
+def decode_delta(buf, offset, base):
+    """Returns the state a delta at offset describes against base."""
+    mask, offset = read_varint(buf, offset)
+    state = list(base)
+
+    i = 0
+    while mask:
+        if mask & 1:
+            value, offset = read_varint(buf, offset)
+            state[i] += (value >> 1) ^ -(value & 1)
+
+        mask >>= 1
+        i += 1
+
+    return state
+
+
+def mac_to_bytes(addr):
+    return bytes(bytearray(int(b, 16) for b in addr.split(":")))
+
+
+def bytes_to_mac(data):
+    return ":".join("{0:02X}".format(b) for b in bytearray(data))
+
+
+def pack_keyframe(index, session, seq, addr, type, state):
+    buf = bytearray(HEADER.pack(MAGIC, PACKET_KEYFRAME, index, session,
+                                seq, 0))
+    buf.extend(KEYFRAME_INFO.pack(mac_to_bytes(addr),
+                                  DEVICE_TYPES.index(type)))
+    encode_delta(buf, state, ZERO_STATE)
+
+    return buf
+
+
+def pack_delta(index, session, seq, base_seq, state, base):
+    buf = bytearray(HEADER.pack(MAGIC, PACKET_DELTA, index, session,
+                                seq, base_seq))
+    encode_delta(buf, state, base)
+
+    return buf
+
+
+def pack_control(packet_type, index, session, seq=0, flags=0):
+    return HEADER.pack(MAGIC, packet_type, index, session, seq, flags)
+
+
+def unpack_header(buf):
+    """Returns the header fields or None if buf is not a valid packet."""
+    if len(buf) < HEADER.size:
+        return None
+
+    header = HEADER.unpack_from(buf, 0)
+    if header[0] != MAGIC:
+        return None
+
+    return header[1:]
+
+
+def unpack_keyframe_info(buf):
+    addr, type = KEYFRAME_INFO.unpack_from(buf, HEADER.size)
+    return bytes_to_mac(addr), DEVICE_TYPES[type]
+
+
+def build_report(state, buf):
+    """Fills buf with a USB HID input report describing state."""
+    values = dict(zip(STATE_NAMES, state))
+
+    buf[0] = 0x01
+    buf[1] = values["left_analog_x"]
+    buf[2] = values["left_analog_y"]
+    buf[3] = values["right_analog_x"]
+    buf[4] = values["right_analog_y"]
+
+    dpad = (bool(values["dpad_up"]), bool(values["dpad_down"]),
+            bool(values["dpad_left"]), bool(values["dpad_right"]))
+    buf[5] = (DPAD_HAT.get(dpad, 8) |
+              values["button_square"] << 4 | values["button_cross"] << 5 |
+              values["button_circle"] << 6 | values["button_triangle"] << 7)
+    buf[6] = (values["button_l1"] | values["button_r1"] << 1 |
+              values["button_l2"] << 2 | values["button_r2"] << 3 |
+              values["button_share"] << 4 | values["button_options"] << 5 |
+              values["button_l3"] << 6 | values["button_r3"] << 7)
+    buf[7] = (values["button_ps"] | values["button_trackpad"] << 1 |
+              (values["timestamp"] & 0x3f) << 2)
+    buf[8] = values["l2_analog"]
+    buf[9] = values["r2_analog"]
+    buf[10] = values["sensor_timestamp"] & 0xff
+    buf[11] = values["sensor_timestamp"] >> 8
+
+    motion = (values["motion_y"], values["motion_x"], values["motion_z"],
+              # Orientation roll is negated by the parser
+              -values["orientation_roll"], values["orientation_yaw"],
+              values["orientation_pitch"])
+    for i, value in enumerate(motion):
+        S16LE.pack_into(buf, 13 + i * 2, max(-32768, min(32767, value)))
+
+    buf[30] = (values["battery"] | values["plug_usb"] << 4 |
+               values["plug_audio"] << 5 | values["plug_mic"] << 6)
+
+    touches = bytearray(8)
+    for offset, touch in ((0, "trackpad_touch0"), (4, "trackpad_touch1")):
+        x, y = values[touch + "_x"], values[touch + "_y"]
+        touches[offset] = (values[touch + "_id"] & 0x7f |
+                           (not values[touch + "_active"]) << 7)
+        touches[offset + 1] = x & 0xff
+        touches[offset + 2] = (x >> 8) & 0x0f | (y & 0x0f) << 4
+        touches[offset + 3] = (y >> 4) & 0xff
+
+    # Trackpad packets are told apart by their timestamp, so a new one
+    # is needed whenever the touches change or they'd be skipped as
+    # already seen. buf is reused between reports and keeps the last one
+    buf[33] = 1
+    if buf[35:43] != touches:
+        buf[34] = (buf[34] + 1) & 0xff
+        buf[35:43] = touches
+
+    return buf
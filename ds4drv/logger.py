@@ -1,20 +1,71 @@
+import atexit
+import os
 import sys
 
-from threading import Lock
+from collections import deque
+from threading import Event, Lock, Thread
+from time import monotonic
+from weakref import WeakSet
+
+from .utils import iter_except
 
 
 LEVELS = ["none", "error", "warning", "info"]
 FORMAT = "[{level}][{module}] {msg}\n"
 
+# Messages waiting to be written, any more are dropped
+QUEUE_SIZE = 1024
+
+# Seconds between writes of queued messages, errors are written right away
+FLUSH_INTERVAL = 0.1
+
+# Repeats of a module's last message within this many seconds are
+# counted instead of logged
+REPEAT_WINDOW = 30
+
+# Messages a module may log at once and per second after that,
+# errors are never held back
+BUDGET_BURST = 50
+BUDGET_RATE = 5
+
 
 class Logger(object):
+    """Logs messages from any thread without blocking it.
+
+    Messages are queued as they are and formatted, written and flushed
+    in batches by a background thread.
+    """
+
     def __init__(self):
         self.output = sys.stdout
         self.level = 0
+        self.queue = deque()
+        self.dropped = 0
+        self.dropped_logged = 0
+        self.modules = WeakSet()
+        self.reset()
+
+        atexit.register(self.flush)
+
+        # Anything queued before a fork would otherwise be lost or written
+        # twice, and the writer thread doesn't exist in the child
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self.flush, after_in_child=self.reset)
+
+    def reset(self):
         self.lock = Lock()
+        self.wakeup = Event()
+        self.thread = None
+
+        for module in self.modules:
+            module.lock = Lock()
+
+    def new_module(self, module, limited=True):
+        logger = LoggerModule(self, module, limited)
+        with self.lock:
+            self.modules.add(logger)
 
-    def new_module(self, module):
-        return LoggerModule(self, module)
+        return logger
 
     def set_level(self, level):
         try:
@@ -25,35 +76,170 @@ class Logger(object):
         self.level = index
 
     def set_output(self, output):
+        self.flush()
         self.output = output
 
+    def start(self):
+        with self.lock:
+            if self.thread:
+                return
+
+            self.thread = Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush_repeats()
+            self.flush()
+
+    def flush_repeats(self):
+        """Logs the repeat counts of modules whose repeat window expired,
+        instead of waiting for their next message."""
+        with self.lock:
+            modules = list(self.modules)
+
+        now = monotonic()
+        for module in modules:
+            module.flush_repeats(now)
+
+    def format(self, module, level, msg, args, kwargs):
+        try:
+            msg = str(msg).format(*args, **kwargs)
+        except (IndexError, KeyError, ValueError):
+            msg = str(msg)
+
+        return FORMAT.format(module=module, level=LEVELS[level], msg=msg)
+
+    def flush(self):
+        """Writes all queued messages."""
+        with self.lock:
+            lines = [self.format(*record) for record in
+                     iter_except(self.queue.popleft, IndexError)]
+
+            dropped = self.dropped - self.dropped_logged
+            if dropped:
+                self.dropped_logged += dropped
+                lines.append(FORMAT.format(
+                    module="logger", level=LEVELS[2],
+                    msg="Dropped {0} messages, too many were "
+                        "logged at once".format(dropped)
+                ))
+
+            if not lines:
+                return
+
+            try:
+                self.output.write("".join(lines))
+                if hasattr(self.output, "flush"):
+                    self.output.flush()
+            except (IOError, ValueError):
+                pass
+
     def msg(self, module, level, msg, *args, **kwargs):
         if self.level < level or level > len(LEVELS):
             return
 
-        msg = str(msg).format(*args, **kwargs)
+        # Appending to a deque is thread safe, so producers never wait
+        # on each other or the writer
+        if len(self.queue) >= QUEUE_SIZE:
+            self.dropped += 1
+            return
 
-        with self.lock:
-            self.output.write(FORMAT.format(module=module,
-                                            level=LEVELS[level],
-                                            msg=msg))
-            if hasattr(self.output, "flush"):
-                self.output.flush()
+        self.queue.append((module, level, msg, args, kwargs))
+
+        if not self.thread:
+            self.start()
+
+        if level == 1:
+            self.wakeup.set()
 
 
 class LoggerModule(object):
-    def __init__(self, manager, module):
+    """Logs the messages of one module.
+
+    Repeats of the last message are collapsed and messages beyond the
+    module's budget are suppressed, so failure loops can't flood the log.
+    """
+
+    def __init__(self, manager, module, limited=True):
         self.manager = manager
         self.module = module
+        self.limited = limited
+
+        self.last = None
+        self.last_time = 0
+        self.repeated = 0
+
+        # The writer thread logs expired repeat counts
+        self.lock = Lock()
+
+        self.budget = BUDGET_BURST
+        self.budget_time = monotonic()
+        self.suppressed = 0
+
+    def unlimited(self):
+        """Returns a logger for the same module without a budget."""
+        return self.manager.new_module(self.module, limited=False)
+
+    def spend(self, now):
+        self.budget = min(BUDGET_BURST, self.budget +
+                          (now - self.budget_time) * BUDGET_RATE)
+        self.budget_time = now
+
+        if self.budget < 1:
+            return False
+
+        self.budget -= 1
+        return True
+
+    def write_repeats(self):
+        self.manager.msg(self.module, self.last[0],
+                         "Last message repeated {0} times", self.repeated)
+        self.repeated = 0
+
+    def flush_repeats(self, now):
+        with self.lock:
+            if self.repeated and now - self.last_time >= REPEAT_WINDOW:
+                self.write_repeats()
+
+    def msg(self, level, msg, *args, **kwargs):
+        if self.manager.level < level:
+            return
+
+        now = monotonic()
+        record = (level, msg, args, kwargs)
+        with self.lock:
+            if record == self.last and now - self.last_time < REPEAT_WINDOW:
+                self.repeated += 1
+                return
+
+            if self.repeated:
+                self.write_repeats()
+
+        if self.limited and level > 1 and not self.spend(now):
+            self.suppressed += 1
+            return
+
+        if self.suppressed:
+            self.manager.msg(self.module, 2, "Suppressed {0} messages, too "
+                             "many were logged", self.suppressed)
+            self.suppressed = 0
+
+        self.last = record
+        self.last_time = now
+        self.manager.msg(self.module, level, msg, *args, **kwargs)
 
     def error(self, msg, *args, **kwargs):
-        self.manager.msg(self.module, 1, msg, *args, **kwargs)
+        self.msg(1, msg, *args, **kwargs)
 
     def warning(self, msg, *args, **kwargs):
-        self.manager.msg(self.module, 2, msg, *args, **kwargs)
+        self.msg(2, msg, *args, **kwargs)
 
     def info(self, msg, *args, **kwargs):
-        self.manager.msg(self.module, 3, msg, *args, **kwargs)
+        self.msg(3, msg, *args, **kwargs)
 
     def debug(self, msg, *args, **kwargs):
-        self.manager.msg(self.module, 4, msg, *args, **kwargs)
+        self.msg(4, msg, *args, **kwargs)
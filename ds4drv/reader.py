@@ -0,0 +1,119 @@
+import os
+import select
+
+from threading import Thread
+from time import monotonic
+
+# Seconds the reader waits for a report before checking if it should stop
+POLL_TIMEOUT = 0.1
+
+
+class ThreadedReader(object):
+    """Reads the reports of a device on a separate thread.
+
+    The thread only reads and validates reports, parsing and everything
+    after it happens on the controller's thread. Reports are handed over
+    through a latest-value mailbox, so when the controller falls behind
+    older reports are overwritten instead of queueing up. A pipe wakes
+    up the controller's event loop, it's watched in place of the device.
+    """
+
+    def __init__(self, device, logger):
+        self.device = device
+        self.logger = logger
+
+        self.report_fd, self.notify_fd = os.pipe()
+        os.set_blocking(self.report_fd, False)
+        os.set_blocking(self.notify_fd, False)
+
+        # Sequence number, raw report and the time it was read. Replaced
+        # in one assignment since it's shared between the threads
+        self.mailbox = (0, None, 0)
+        self.taken = 0
+        self.pending = False
+        self.disconnected = False
+        self.running = False
+
+        self.reports = 0
+        self.overwritten = 0
+        self.delay_max = 0
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _worker(self):
+        poller = select.poll()
+        poller.register(self.device.report_fd, select.POLLIN)
+
+        seq = 0
+        while self.running:
+            if not poller.poll(POLL_TIMEOUT * 1000):
+                continue
+
+            buf = self.device.read_raw_report()
+            if buf is None:
+                self.disconnected = True
+                self.notify()
+                return
+
+            if buf is False:
+                continue
+
+            if self.mailbox[0] > self.taken:
+                self.overwritten += 1
+
+            seq += 1
+            self.mailbox = (seq, bytes(buf), monotonic())
+            self.notify()
+
+    def notify(self):
+        # Only one wake up is needed until the controller takes a report
+        if self.pending:
+            return
+
+        self.pending = True
+        try:
+            os.write(self.notify_fd, b"\0")
+        except OSError:
+            pass
+
+    def read_report(self):
+        """Parses the latest report, behaves like DS4Device.read_report."""
+        try:
+            os.read(self.report_fd, 64)
+        except OSError:
+            pass
+
+        # Cleared before taking the report, a report arriving after this
+        # wakes up the controller again
+        self.pending = False
+
+        seq, buf, read_time = self.mailbox
+        if seq == self.taken:
+            return None if self.disconnected else False
+
+        self.taken = seq
+        self.reports += 1
+        self.delay_max = max(self.delay_max, monotonic() - read_time)
+
+        # The disconnect may have been noticed while this report was
+        # pending, come back for it
+        if self.disconnected:
+            self.notify()
+
+        return self.device.parse_report(buf)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+        os.close(self.report_fd)
+        os.close(self.notify_fd)
+
+        self.logger.info("Reader thread handed over {0} reports, {1} "
+                         "overwritten before they were processed, longest "
+                         "hand over took {2:.2f} ms", self.reports,
+                         self.overwritten, self.delay_max * 1000)
@@ -1 +1,3 @@
+from .forward import ForwardServer
+from .shm import SharedMemoryReader, SharedMemoryServer
 from .udp import UDPServer
@@ -0,0 +1,136 @@
+import socket
+
+from collections import OrderedDict
+from operator import attrgetter
+from threading import Thread
+
+from ..forwarding import (ACK_KEYFRAME_REQUEST, MAX_PACKET_SIZE, PACKET_ACK,
+                          PACKET_BYE, new_session, pack_control, pack_delta,
+                          pack_keyframe, unpack_header)
+from ..device import STATE_NAMES
+
+# Sent states kept around for when their acknowledgement arrives
+HISTORY_SIZE = 64
+
+
+class ForwardStream(object):
+    """Delta encodes the reports of one controller."""
+
+    def __init__(self, server, index, keyframe_interval):
+        self.server = server
+        self.index = index
+        self.keyframe_interval = keyframe_interval
+        self.get_state = attrgetter(*STATE_NAMES)
+        self.reset()
+
+    def reset(self):
+        self.session = new_session()
+        self.seq = 0
+        self.history = OrderedDict()
+        self.base = None
+        self.since_keyframe = 0
+        self.keyframe_requested = True
+
+    def send(self, device, report):
+        state = self.get_state(report)
+        self.seq += 1
+
+        base = self.base
+        if (base is None or self.keyframe_requested or
+            self.since_keyframe >= self.keyframe_interval):
+            self.keyframe_requested = False
+            self.since_keyframe = 0
+            packet = pack_keyframe(self.index, self.session, self.seq,
+                                   device.device_addr, device.type, state)
+        else:
+            base_seq, base_state = base
+            self.since_keyframe += 1
+            packet = pack_delta(self.index, self.session, self.seq,
+                                base_seq, state, base_state)
+
+        self.history[self.seq] = state
+        if len(self.history) > HISTORY_SIZE:
+            self.history.popitem(last=False)
+
+        self.server.send(packet)
+
+    def ack(self, seq, flags):
+        if flags & ACK_KEYFRAME_REQUEST:
+            self.keyframe_requested = True
+            return
+
+        state = self.history.get(seq)
+        base = self.base
+        if state is not None and (base is None or seq > base[0]):
+            # Replaced in one assignment since acks arrive on another thread
+            self.base = (seq, state)
+
+    def bye(self):
+        self.server.send(pack_control(PACKET_BYE, self.index, self.session,
+                                      self.seq))
+        self.reset()
+
+
+class ForwardServer(object):
+    """Forwards controllers to the receiver backend of a remote ds4drv."""
+
+    def __init__(self, manager, host, port=26770, keyframe_interval=250):
+        self.logger = manager.new_module("forward")
+        self.keyframe_interval = keyframe_interval
+        self.streams = {}
+
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+
+    def register_controller(self, controller):
+        index = controller.index
+        stream = ForwardStream(self, index, self.keyframe_interval)
+        self.streams[index] = stream
+
+        def handle_report(report):
+            stream.send(controller.device, report)
+
+        controller.loop.register_event("device-setup",
+                                       lambda device: stream.reset())
+        controller.loop.register_event("device-cleanup", stream.bye)
+        controller.loop.register_event("device-report", handle_report)
+
+    def send(self, packet):
+        try:
+            self.sock.send(packet)
+        except socket.error:
+            # Nothing is listening yet, the next keyframe will catch up
+            pass
+
+    def _handle_packet(self, packet):
+        header = unpack_header(packet)
+        if not header:
+            return
+
+        packet_type, index, session, seq, flags = header
+        stream = self.streams.get(index)
+        if packet_type != PACKET_ACK or not stream:
+            return
+
+        if session == stream.session:
+            stream.ack(seq, flags)
+        else:
+            stream.keyframe_requested = True
+
+    def _worker(self):
+        while True:
+            try:
+                packet = self.sock.recv(MAX_PACKET_SIZE)
+            except socket.error:
+                continue
+
+            self._handle_packet(packet)
+
+    def start(self):
+        self.logger.info("Forwarding controllers to {0[0]}:{0[1]}",
+                         self.sock.getpeername())
+
+        self.thread = Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
@@ -0,0 +1,271 @@
+"""Publishes controller state to same-host consumers via shared memory.
+
+Every controller gets its own file (by default /dev/shm/ds4drv-<index>)
+containing a header followed by a ring of fixed size slots. Each report
+is written to the next slot using a seqlock: the slot sequence number is
+odd while the slot is being written and even once it is complete. The
+header holds the number of reports published so far, which also tells
+readers where the latest slot is.
+
+Readers never block the writer, they simply retry (or give up on) a slot
+that changed while they were copying it. SharedMemoryReader implements
+the reader side of the protocol.
+"""
+
+from __future__ import division
+
+import atexit
+import mmap
+import os
+import struct
+
+from collections import namedtuple
+from operator import attrgetter
+from time import monotonic, sleep
+
+from ..device import STATE_FIELDS, STATE_NAMES, DS4Report
+
+MAGIC = b"DS4SHM\x00\x00"
+VERSION = 2
+
+FLAG_CONNECTED = 0x01
+
+# magic, version, flags, slot count, slot size, raw size, reports written
+HEADER = struct.Struct("<8sIIIIIxxxxQ")
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = HEADER.size - COUNT.size
+
+# sequence, monotonic timestamp (ns), report number
+SLOT_HEADER = struct.Struct("<IxxxxQQ")
+SEQ = struct.Struct("<I")
+STATE = struct.Struct("<" + "".join(code for name, code in STATE_FIELDS))
+RAW_LENGTH = struct.Struct("<H")
+
+RAW_REPORT_SIZE = 80
+READ_RETRIES = 16
+
+SharedMemoryRecord = namedtuple("SharedMemoryRecord",
+                                "number timestamp report raw")
+
+
+def slot_size(raw_size):
+    size = SLOT_HEADER.size + STATE.size + RAW_LENGTH.size + raw_size
+    # Keep slots 8-byte aligned
+    return (size + 7) & ~7
+
+
+class SharedMemoryRing(object):
+    """The writer side of a single controller's ring."""
+
+    def __init__(self, path, slots, raw_size=0):
+        self.path = path
+        self.slots = slots
+        self.raw_size = raw_size
+        self.slot_size = slot_size(raw_size)
+        self.count = 0
+        self.flags = 0
+        self.seqs = [0] * slots
+
+        size = HEADER.size + slots * self.slot_size
+        # A fresh file, so a symlink or file planted in the shared
+        # directory can't redirect our writes
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL |
+                     os.O_NOFOLLOW, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self.mmap, 0, MAGIC, VERSION, self.flags,
+                         self.slots, self.slot_size, self.raw_size,
+                         self.count)
+
+    def set_connected(self, connected):
+        if connected:
+            self.flags |= FLAG_CONNECTED
+        else:
+            self.flags &= ~FLAG_CONNECTED
+
+        self._write_header()
+
+    def publish(self, state, raw=None):
+        mm = self.mmap
+        index = self.count % self.slots
+        offset = HEADER.size + index * self.slot_size
+
+        # Odd sequence number marks the slot as being written
+        seq = self.seqs[index] + 1
+        SLOT_HEADER.pack_into(mm, offset, seq, int(monotonic() * 10**9),
+                              self.count)
+        state_offset = offset + SLOT_HEADER.size
+        STATE.pack_into(mm, state_offset, *state)
+
+        if self.raw_size:
+            raw_offset = state_offset + STATE.size
+            length = min(len(raw), self.raw_size) if raw else 0
+            RAW_LENGTH.pack_into(mm, raw_offset, length)
+            if length:
+                start = raw_offset + RAW_LENGTH.size
+                mm[start:start + length] = raw[:length]
+
+        self.seqs[index] = seq + 1
+        SEQ.pack_into(mm, offset, seq + 1)
+
+        self.count += 1
+        COUNT.pack_into(mm, COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.mmap.close()
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class SharedMemoryServer(object):
+    def __init__(self, manager, path="/dev/shm/ds4drv", slots=256,
+                 raw=False):
+        self.logger = manager.new_module("shm")
+        self.path = path
+        self.slots = slots
+        self.raw_size = raw and RAW_REPORT_SIZE or 0
+        self.rings = {}
+
+        atexit.register(self.close)
+
+    def register_controller(self, controller):
+        path = "{0}-{1}".format(self.path, controller.index)
+        ring = SharedMemoryRing(path, self.slots, self.raw_size)
+        self.rings[controller.index] = ring
+        self.logger.info("Publishing controller {0} state to {1}",
+                         controller.index, path)
+
+        get_state = attrgetter(*STATE_NAMES)
+
+        def handle_report(report):
+            raw = None
+            if ring.raw_size:
+                raw = controller.device.last_raw
+
+            ring.publish(get_state(report), raw)
+
+        controller.loop.register_event("device-setup",
+                                       lambda device: ring.set_connected(True))
+        controller.loop.register_event("device-cleanup",
+                                       lambda: ring.set_connected(False))
+        controller.loop.register_event("device-report", handle_report)
+
+    def close(self):
+        for ring in self.rings.values():
+            ring.close()
+
+        self.rings = {}
+
+
+class SharedMemoryReader(object):
+    """Reads controller state published by SharedMemoryServer.
+
+    Example::
+
+        reader = SharedMemoryReader("/dev/shm/ds4drv-1")
+        record = reader.latest()
+        if record:
+            print(record.report.left_analog_x)
+    """
+
+    def __init__(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            self.mmap = mmap.mmap(fd, size, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+        (magic, version, flags, self.slots, self.slot_size,
+         self.raw_size, count) = HEADER.unpack_from(self.mmap, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self.mmap.close()
+            raise ValueError("Unsupported shared memory file: {0}".format(path))
+
+    @property
+    def count(self):
+        """Number of reports published so far."""
+        return COUNT.unpack_from(self.mmap, COUNT_OFFSET)[0]
+
+    @property
+    def connected(self):
+        flags = HEADER.unpack_from(self.mmap, 0)[2]
+        return bool(flags & FLAG_CONNECTED)
+
+    def latest(self):
+        """Returns the most recent record, or None if nothing is published."""
+        for i in range(READ_RETRIES):
+            count = self.count
+            if not count:
+                return None
+
+            record = self.read(count - 1)
+            if record:
+                return record
+
+        return None
+
+    def read(self, number):
+        """Returns record `number`, or None if it has been overwritten."""
+        mm = self.mmap
+        offset = HEADER.size + (number % self.slots) * self.slot_size
+
+        for i in range(READ_RETRIES):
+            seq = SEQ.unpack_from(mm, offset)[0]
+            if seq & 1:
+                sleep(0)
+                continue
+
+            data = mm[offset:offset + self.slot_size]
+            if SEQ.unpack_from(mm, offset)[0] != seq:
+                continue
+
+            seq, timestamp, slot_number = SLOT_HEADER.unpack_from(data, 0)
+            if slot_number != number:
+                return None
+
+            return self._decode(data, number, timestamp)
+
+        return None
+
+    def history(self, since=0):
+        """Yields all records still in the ring from number `since` on."""
+        count = self.count
+        for number in range(max(since, count - self.slots), count):
+            record = self.read(number)
+            if record:
+                yield record
+
+    def _decode(self, data, number, timestamp):
+        report = DS4Report()
+        values = STATE.unpack_from(data, SLOT_HEADER.size)
+        for name, value in zip(STATE_NAMES, values):
+            setattr(report, name, value)
+
+        raw = None
+        if self.raw_size:
+            raw_offset = SLOT_HEADER.size + STATE.size
+            length = RAW_LENGTH.unpack_from(data, raw_offset)[0]
+            start = raw_offset + RAW_LENGTH.size
+            raw = bytes(data[start:start + length])
+
+        return SharedMemoryRecord(number, timestamp / 10**9, report, raw)
+
+    def close(self):
+        self.mmap.close()
@@ -1,13 +1,34 @@
 from __future__ import division
 from builtins import bytes
 
-from threading import Thread
+from collections import OrderedDict
+from threading import Event, Lock, Thread
 import sys
 import socket
 import struct
 from binascii import crc32
 from time import time
 
+CLIENT_TIMEOUT = 5        # Seconds without a data request before dropping
+SWEEP_INTERVAL = 1        # Seconds between client table sweeps
+LOG_CLIENTS_MAX = 5       # Clients listed by name in a batched log message
+
+
+def button_table(targets):
+    """Maps each byte to a DSU button byte, bit i of the byte is moved
+    to bit targets[i]."""
+    return tuple(sum(1 << target for i, target in enumerate(targets)
+                     if value >> i & 1)
+                 for value in range(256))
+
+
+# Indexed by dpad up, down, left, right, share, options, l3 and r3 bits
+BUTTONS1 = button_table((4, 6, 7, 5, 0, 3, 1, 2))
+
+# Indexed by l1, r1, l2, r2, square, cross, circle and triangle bits
+BUTTONS2 = button_table((2, 3, 0, 1, 7, 6, 5, 4))
+BUTTONS2_REMAPPED = button_table((2, 3, 0, 1, 4, 5, 6, 7))
+
 
 class Message(list):
     Types = dict(version=bytes([0x00, 0x00, 0x10, 0x00]),
@@ -38,7 +59,8 @@ class Message(list):
 
 
 class Registration:
-    def __init__(self, mode=0, slot=None, mac=None):
+    def __init__(self, sock, mode=0, slot=None, mac=None):
+        self.sock = sock
         self.mode = mode
         self.slot = slot
 
@@ -49,12 +71,11 @@ class Registration:
 
         self.refresh()
 
-    @property
-    def timed_out(self):
-        return time() - self.ts > 5
+    def timed_out(self, now):
+        return now - self.ts > CLIENT_TIMEOUT
 
-    def refresh(self):
-        self.ts = time()
+    def refresh(self, now=None):
+        self.ts = now or time()
 
     @property
     def mode_str(self):
@@ -80,16 +101,160 @@ class Registration:
         return False
 
 
+class RateLimit(object):
+    """Token bucket allowing `rate` requests per second."""
+
+    def __init__(self, rate, now):
+        self.rate = rate
+        self.tokens = rate
+        self.ts = now
+
+    def allow(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class ClientRegistry(object):
+    """Capacity bounded table of clients registered for data.
+
+    The least recently refreshed client is evicted when the table is
+    full, and timed out clients are removed by expire() which the server
+    calls from a timer. Readers on the report path only see the immutable
+    `targets` tuple, which is rebuilt whenever the table changes.
+    """
+
+    def __init__(self, capacity=64, rate=20):
+        self.capacity = capacity
+        self.rate = rate
+        self.clients = OrderedDict()
+        self.limits = OrderedDict()
+        self.targets = ()
+        self.connected = []
+        self.disconnected = []
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.targets)
+
+    def allow(self, address, now):
+        """Returns False if the source has exceeded its request rate."""
+        if not self.rate:
+            return True
+
+        host = address[0]
+
+        with self.lock:
+            limit = self.limits.pop(host, None)
+            if limit is None:
+                limit = RateLimit(self.rate, now)
+                # Sources are evicted in LRU order just like clients
+                while len(self.limits) >= self.capacity * 4:
+                    self.limits.popitem(last=False)
+
+            self.limits[host] = limit
+
+            return limit.allow(now)
+
+    def register(self, sock, address, mode, slot, mac, now):
+        with self.lock:
+            registration = self.clients.pop(address, None)
+            if registration:
+                registration.refresh(now)
+                self.clients[address] = registration
+                return
+
+            while len(self.clients) >= self.capacity:
+                evicted, _ = self.clients.popitem(last=False)
+                self.disconnected.append(evicted)
+
+            registration = Registration(sock, mode, slot, mac)
+            self.clients[address] = registration
+            self.connected.append((address, registration))
+            self._update_targets()
+
+    def expire(self, now):
+        with self.lock:
+            expired = [address for address, registration
+                       in self.clients.items()
+                       if registration.timed_out(now)]
+
+            for address in expired:
+                del self.clients[address]
+                self.disconnected.append(address)
+
+            if expired:
+                self._update_targets()
+
+            connected, self.connected = self.connected, []
+            disconnected, self.disconnected = self.disconnected, []
+
+        return connected, disconnected
+
+    def _update_targets(self):
+        self.targets = tuple(self.clients.items())
+
+
+def format_clients(clients):
+    """Joins client descriptions, eliding all but the first few."""
+    names = list(clients[:LOG_CLIENTS_MAX])
+
+    if len(clients) > LOG_CLIENTS_MAX:
+        names.append('and {0} more'.format(len(clients) - LOG_CLIENTS_MAX))
+
+    return ', '.join(names)
+
+
 class UDPServer:
-    def __init__(self, host='', port=26760):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((host, port))
-        self.clients = dict()
+    def __init__(self, manager, host='', port=26760, workers=1,
+                 max_clients=64, rate_limit=20):
+        self.logger = manager.new_module("udp")
+
+        hosts = [host] if isinstance(host, str) else host
+
+        # Each address gets one socket per worker. With more than one
+        # worker the sockets share the port via SO_REUSEPORT and the
+        # kernel spreads clients across them by source address.
+        self.socks = []
+        for address in hosts:
+            for i in range(workers):
+                sock = self._create_socket(address, port,
+                                           reuse_port=workers > 1)
+                self.socks.append(sock)
+
+        self.threads = []
+        self.clients = ClientRegistry(max_clients, rate_limit)
+        self.stopped = Event()
         self.remap = False
         self.send_touch = True
         self.controllers = {}
         self.counters = {}
 
+    @staticmethod
+    def _create_socket(host, port, reuse_port=False):
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+
+        if reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise ValueError('SO_REUSEPORT is not supported, '
+                                 'use a single UDP worker')
+
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        # Accept IPv4 clients too when listening on the IPv6 wildcard
+        if family == socket.AF_INET6 and host == '::':
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+
+        sock.bind((host, port))
+
+        return sock
+
     def register_controller(self, controller):
         index = controller.index - 1
 
@@ -137,8 +302,9 @@ class UDPServer:
     def _compat_ord(value):
         return ord(value) if sys.version_info < (3, 0) else value
 
-    def _req_ports(self, message, address):
+    def _req_ports(self, sock, message, address):
         requests_count = struct.unpack("<i", message[20:24])[0]
+        requests_count = min(requests_count, len(message) - 24)
 
         for i in range(requests_count):
             index = self._compat_ord(message[24 + i])
@@ -146,31 +312,29 @@ class UDPServer:
             if (index > len(self.controllers) - 1):
                 continue
 
-            self.sock.sendto(bytes(self._res_ports(index)), address)
+            sock.sendto(bytes(self._res_ports(index)), address)
+
+    def _req_data(self, sock, message, address, now):
+        if len(message) < 28:
+            return
 
-    def _req_data(self, message, address):
         mode = self._compat_ord(message[20])
         slot = self._compat_ord(message[21])
         mac = message[22:28]
 
-        if address not in self.clients:
-            reg = Registration(mode, slot, mac)
-            self.clients[address] = reg
-            print('[udp] Client connected: {0[0]}:{0[1]} (mode: {1})'.format(address, reg.mode_str))
-        else:
-            self.clients[address].refresh()
+        self.clients.register(sock, address, mode, slot, mac, now)
 
     def _res_data(self, message, index, controller):
-        for address, registration in self.clients.copy().items():
-            if not registration.timed_out:
-                if registration.match(index, controller):
-                    self.sock.sendto(message, address)
-            else:
-                print('[udp] Client disconnected: {0[0]}:{0[1]}'.format(address))
-                del self.clients[address]
+        for address, registration in self.clients.targets:
+            if registration.match(index, controller):
+                registration.sock.sendto(message, address)
 
-    def _handle_request(self, request):
+    def _handle_request(self, sock, request):
         message, address = request
+        now = time()
+
+        if len(message) < 24 or not self.clients.allow(address, now):
+            return
 
         # client_id = message[12:16]
         msg_type = message[16:20]
@@ -178,14 +342,14 @@ class UDPServer:
         if msg_type == Message.Types['version']:
             return
         elif msg_type == Message.Types['ports']:
-            self._req_ports(message, address)
+            self._req_ports(sock, message, address)
         elif msg_type == Message.Types['data']:
-            self._req_data(message, address)
+            self._req_data(sock, message, address, now)
         else:
-            print('[udp] Unknown message type: ' + str(msg_type))
+            self.logger.warning("Unknown message type: {0}", msg_type)
 
     def report(self, index, controller, report):
-        if len(self.clients) == 0:
+        if not self.clients.targets:
             return None
 
         # Ignore outdated callbacks
@@ -200,31 +364,13 @@ class UDPServer:
         data.extend(bytes(struct.pack('<I', self.counters[index])))
         self.counters[index] += 1
 
-        buttons1 = 0x00
-        buttons1 |= report.button_share
-        buttons1 |= report.button_l3 << 1
-        buttons1 |= report.button_r3 << 2
-        buttons1 |= report.button_options << 3
-        buttons1 |= report.dpad_up << 4
-        buttons1 |= report.dpad_right << 5
-        buttons1 |= report.dpad_down << 6
-        buttons1 |= report.dpad_left << 7
-
-        buttons2 = 0x00
-        buttons2 |= report.button_l2
-        buttons2 |= report.button_r2 << 1
-        buttons2 |= report.button_l1 << 2
-        buttons2 |= report.button_r1 << 3
+        # See BUTTON_MASKS of the device for the bits of the word
+        word = report.buttons
+        buttons1 = BUTTONS1[word & 0x0f | word >> 8 & 0xf0]
         if not self.remap:
-            buttons2 |= report.button_triangle << 4
-            buttons2 |= report.button_circle << 5
-            buttons2 |= report.button_cross << 6
-            buttons2 |= report.button_square << 7
+            buttons2 = BUTTONS2[word >> 8 & 0x0f | word & 0xf0]
         else:
-            buttons2 |= report.button_triangle << 7
-            buttons2 |= report.button_circle << 6
-            buttons2 |= report.button_cross << 5
-            buttons2 |= report.button_square << 4
+            buttons2 = BUTTONS2_REMAPPED[word >> 8 & 0x0f | word & 0xf0]
 
         data.extend([
             buttons1, buttons2,
@@ -293,11 +439,38 @@ class UDPServer:
 
         self._res_data(bytes(Message('data', data)), index, controller)
 
-    def _worker(self):
+    def _worker(self, sock):
         while True:
-            self._handle_request(self.sock.recvfrom(1024))
+            self._handle_request(sock, sock.recvfrom(1024))
+
+    def _sweeper(self):
+        while not self.stopped.wait(SWEEP_INTERVAL):
+            connected, disconnected = self.clients.expire(time())
+
+            if connected:
+                clients = ['{0[0]}:{0[1]} (mode: {1})'.format(address,
+                                                              reg.mode_str)
+                           for address, reg in connected]
+                self.logger.info("Clients connected: {0}",
+                                 format_clients(clients))
+
+            if disconnected:
+                clients = ['{0[0]}:{0[1]}'.format(address)
+                           for address in disconnected]
+                self.logger.info("Clients disconnected: {0}",
+                                 format_clients(clients))
 
     def start(self):
-        self.thread = Thread(target=self._worker)
-        self.thread.daemon = True
-        self.thread.start()
+        for sock in self.socks:
+            thread = Thread(target=self._worker, args=(sock,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+        thread = Thread(target=self._sweeper)
+        thread.daemon = True
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
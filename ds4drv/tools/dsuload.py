@@ -0,0 +1,378 @@
+"""Load generator and latency harness for the DSU (cemuhook) UDP server.
+
+Simulates many DSU clients on one host. Each client registers for data
+in one of the three registration modes, keeps the registration alive
+and validates every packet it receives. Optionally a number of
+synthetic controllers are served by an in-process UDPServer, which
+makes it possible to load test the server without any hardware.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import math
+import socket
+import struct
+import sys
+
+from array import array
+from binascii import crc32
+from select import epoll, EPOLLIN
+from threading import Thread
+from time import sleep, time
+
+from ..device import DS4Device
+from ..logger import Logger
+from ..servers.udp import Message, UDPServer
+
+HEADER = struct.Struct("<4sHHII4s")
+COUNTER = struct.Struct("<I")
+TIMESTAMP = struct.Struct("<Q")
+
+DATA_PACKET_SIZE = 100
+COUNTER_OFFSET = 32
+TIMESTAMP_OFFSET = 68
+
+MODES = {"all": 0, "slot": 1, "mac": 2}
+
+
+def build_request(message_type, data, client_id):
+    """Builds a client request with a valid CRC."""
+    data = bytes(bytearray(data))
+    packet = bytearray(HEADER.pack(b"DSUC", 1001, len(data) + 4, 0,
+                                   client_id, Message.Types[message_type]))
+    packet.extend(data)
+    packet[8:12] = struct.pack("<I", crc32(bytes(packet)) & 0xffffffff)
+
+    return bytes(packet)
+
+
+def valid_crc(packet):
+    crc, = struct.unpack_from("<I", packet, 8)
+    packet = bytearray(packet)
+    packet[8:12] = b"\x00\x00\x00\x00"
+
+    return crc32(bytes(packet)) & 0xffffffff == crc
+
+
+def parse_mac(mac):
+    return [int(b, 16) for b in mac.split(":")]
+
+
+class ClientStats(object):
+    def __init__(self):
+        self.packets = 0
+        self.ports = 0
+        self.crc_errors = 0
+        self.gaps = 0
+        self.reordered = 0
+        self.latencies = array("d")
+        self.counters = {}
+
+
+class SimulatedClient(object):
+    """A single DSU client with its own socket and source port."""
+
+    def __init__(self, client_id, address, mode, slot=0, mac=None):
+        family = socket.AF_INET6 if ":" in address[0] else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.address = address
+        self.client_id = client_id
+        self.mode = mode
+        self.slot = slot
+        self.mac = mac or [0] * 6
+        self.stats = ClientStats()
+        self.last_register = 0
+
+    def request_ports(self, slots):
+        data = list(struct.pack("<i", len(slots))) + list(slots)
+        self.send(build_request("ports", data, self.client_id))
+
+    def register(self, now):
+        data = [MODES[self.mode], self.slot] + list(self.mac)
+        self.send(build_request("data", data, self.client_id))
+        self.last_register = now
+
+    def send(self, packet):
+        try:
+            self.sock.sendto(packet, self.address)
+        except socket.error:
+            pass
+
+    def receive(self):
+        while True:
+            try:
+                packet = self.sock.recv(1024)
+            except socket.error:
+                return
+
+            self.handle_packet(packet, time())
+
+    def handle_packet(self, packet, now):
+        stats = self.stats
+
+        if len(packet) < HEADER.size or not valid_crc(packet):
+            stats.crc_errors += 1
+            return
+
+        msg_type = packet[16:20]
+        if msg_type == Message.Types["ports"]:
+            stats.ports += 1
+            return
+        elif msg_type != Message.Types["data"]:
+            return
+
+        if len(packet) < DATA_PACKET_SIZE:
+            stats.crc_errors += 1
+            return
+
+        stats.packets += 1
+
+        slot = bytearray(packet)[20]
+        counter, = COUNTER.unpack_from(packet, COUNTER_OFFSET)
+        last = stats.counters.get(slot)
+        if last is not None:
+            if counter > last + 1:
+                stats.gaps += counter - last - 1
+            elif counter <= last:
+                stats.reordered += 1
+                return
+
+        stats.counters[slot] = counter
+
+        timestamp, = TIMESTAMP.unpack_from(packet, TIMESTAMP_OFFSET)
+        stats.latencies.append(now - timestamp / 10**6)
+
+
+class SyntheticLoop(object):
+    def __init__(self):
+        self.callbacks = []
+
+    def register_event(self, event, callback):
+        if event == "device-report":
+            self.callbacks.append(callback)
+
+
+class SyntheticDS4Device(DS4Device):
+    def __init__(self, index):
+        addr = "00:00:00:00:00:{0:02X}".format(index)
+        self.buf = bytearray(64)
+        self.buf[0] = 0x01
+        self.frame = 0
+
+        super(SyntheticDS4Device, self).__init__(addr, addr, "usb")
+
+    def next_report(self):
+        """Generates a USB HID report with moving sticks and buttons."""
+        buf = self.buf
+        phase = self.frame / 100
+
+        buf[1] = int(128 + 127 * math.sin(phase))
+        buf[2] = int(128 + 127 * math.cos(phase))
+        buf[3] = 255 - buf[1]
+        buf[4] = 255 - buf[2]
+        buf[5] = 8 | ((self.frame // 50) % 16) << 4
+        buf[7] = (self.frame % 64) << 2
+        buf[8] = buf[9] = self.frame % 256
+        # 4 ms per report in units of 16/3 microseconds
+        struct.pack_into("<H", buf, 10, (self.frame * 750) & 0xffff)
+        struct.pack_into("<hhhhhh", buf, 13, *[self.frame % 1024] * 6)
+        buf[30] = 0x1b
+        buf[35] = buf[39] = 0x80
+
+        self.frame += 1
+
+        return self.parse_report(buf)
+
+
+class SyntheticController(object):
+    """Stands in for a DS4Controller with a device attached."""
+
+    def __init__(self, index):
+        self.index = index
+        self.device = SyntheticDS4Device(index)
+        self.loop = SyntheticLoop()
+
+    def emit(self):
+        report = self.device.next_report()
+        for callback in self.loop.callbacks:
+            callback(report)
+
+
+def run_synthetic_controllers(controllers, rate, duration):
+    interval = 1 / rate
+    start = time()
+    frame = 0
+
+    while time() - start < duration:
+        for controller in controllers:
+            controller.emit()
+
+        frame += 1
+        delay = start + frame * interval - time()
+        if delay > 0:
+            sleep(delay)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def print_summary(clients, duration):
+    row = "{0:>6} {1:>5} {2:>8} {3:>8} {4:>5} {5:>6} {6:>6} {7:>8} {8:>8} {9:>8}"
+
+    print(row.format("client", "mode", "packets", "pkt/s", "crc", "gaps",
+                     "reord", "avg ms", "p99 ms", "max ms"))
+
+    total = ClientStats()
+    for client in clients:
+        stats = client.stats
+        latencies = stats.latencies
+
+        total.packets += stats.packets
+        total.crc_errors += stats.crc_errors
+        total.gaps += stats.gaps
+        total.reordered += stats.reordered
+        total.latencies.extend(latencies)
+
+        print(row.format(client.client_id, client.mode, stats.packets,
+                         int(stats.packets / duration), stats.crc_errors,
+                         stats.gaps, stats.reordered,
+                         *format_latencies(latencies)))
+
+    print(row.format("total", "", total.packets,
+                     int(total.packets / duration), total.crc_errors,
+                     total.gaps, total.reordered,
+                     *format_latencies(total.latencies)))
+
+
+def format_latencies(latencies):
+    if not latencies:
+        return "-", "-", "-"
+
+    avg = sum(latencies) / len(latencies)
+    return ("{0:.3f}".format(avg * 1000),
+            "{0:.3f}".format(percentile(latencies, 0.99) * 1000),
+            "{0:.3f}".format(max(latencies) * 1000))
+
+
+def create_clients(args, macs):
+    modes = args.modes
+    clients = []
+
+    for i in range(args.clients):
+        mode = modes[i % len(modes)]
+        slot = args.slot
+        mac = args.mac and parse_mac(args.mac)
+
+        # Spread slot and MAC registrations over the synthetic controllers
+        if macs:
+            slot = i % len(macs)
+            mac = mac or macs[i % len(macs)]
+
+        clients.append(SimulatedClient(i, (args.host, args.port), mode,
+                                       slot=slot, mac=mac))
+
+    return clients
+
+
+def run_clients(clients, duration, register_interval):
+    poller = epoll()
+    by_fd = {}
+
+    for client in clients:
+        by_fd[client.sock.fileno()] = client
+        poller.register(client.sock.fileno(), EPOLLIN)
+        client.request_ports(range(4))
+
+    start = time()
+    while True:
+        now = time()
+        if now - start >= duration:
+            break
+
+        for client in clients:
+            if now - client.last_register >= register_interval:
+                client.register(now)
+
+        for fd, event in poller.poll(0.05):
+            by_fd[fd].receive()
+
+    poller.close()
+
+
+def modelist(s):
+    modes = [mode.strip() for mode in s.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            raise ValueError("Invalid mode: {0}".format(mode))
+
+    return modes
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="ds4drv-dsuload",
+                                     description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address of the DSU server")
+    parser.add_argument("--port", type=int, default=26760,
+                        help="Port of the DSU server")
+    parser.add_argument("--clients", type=int, default=50,
+                        help="Number of simulated clients")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="Seconds to run the test for")
+    parser.add_argument("--modes", type=modelist, default="all,slot,mac",
+                        help="Registration modes assigned round-robin to "
+                             "the clients, any of 'all', 'slot' and 'mac'")
+    parser.add_argument("--slot", type=int, default=0,
+                        help="Slot to register for in slot mode")
+    parser.add_argument("--mac", metavar="MAC",
+                        help="Controller MAC to register for in mac mode")
+    parser.add_argument("--register-interval", type=float, default=1,
+                        help="Seconds between data requests, must be below "
+                             "the server's 5 second client timeout")
+    parser.add_argument("--synthetic", metavar="N", type=int, default=0,
+                        help="Serve N synthetic controllers from an "
+                             "in-process UDP server instead of testing an "
+                             "already running ds4drv")
+    parser.add_argument("--rate", type=float, default=250,
+                        help="Reports per second of each synthetic "
+                             "controller")
+    parser.add_argument("--udp-workers", type=int, default=1,
+                        help="Workers of the in-process UDP server")
+
+    args = parser.parse_args()
+
+    macs = []
+    if args.synthetic:
+        server = UDPServer(Logger(), args.host, args.port, args.udp_workers,
+                           max_clients=args.clients, rate_limit=0)
+        controllers = []
+        for index in range(1, args.synthetic + 1):
+            controller = SyntheticController(index)
+            server.register_controller(controller)
+            controllers.append(controller)
+            macs.append(parse_mac(controller.device.device_addr))
+
+        server.start()
+
+        thread = Thread(target=run_synthetic_controllers,
+                        args=(controllers, args.rate, args.duration))
+        thread.daemon = True
+        thread.start()
+
+    clients = create_clients(args, macs)
+    run_clients(clients, args.duration, args.register_interval)
+    print_summary(clients, args.duration)
+
+    if any(client.stats.crc_errors for client in clients):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
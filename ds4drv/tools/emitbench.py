@@ -0,0 +1,173 @@
+"""Benchmark of UInputDevice.emit for each built-in mapping.
+
+Synthetic reports with moving sticks, triggers and buttons are emitted
+to devices writing to a NullSink, so no uinput access is needed. Each
+mapping is also measured with an unchanged report, where every value
+hits the last written value and nothing is written.
+
+The hysteresis filter is measured on one mapping with two captures:
+resting sticks with jitter and sensor noise, and moving sticks. Both
+are emitted with and without a threshold on every filter group, and
+shown as events per second at a controller's report rate.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import random
+
+from time import perf_counter
+
+from ..device import MOTION
+from ..uinput import (FILTER_GROUPS, MOUSE_INTERVAL, NullSink,
+                      create_uinput_device)
+from .dsuload import SyntheticDS4Device
+
+MAPPINGS = ("ds4", "xpad", "xpad_wireless", "xboxdrv", "mouse")
+
+# Largest deviation of resting sticks and motion sensors in the jitter
+# capture
+STICK_JITTER = 2
+MOTION_NOISE = 8
+
+
+def generate_reports(count):
+    device = SyntheticDS4Device(1)
+    return [device.next_report() for i in range(count)]
+
+
+def generate_jitter_reports(count, seed=0):
+    """Returns reports of a put down controller, sticks and motion
+    sensors only vary by noise."""
+    rand = random.Random(seed)
+    device = SyntheticDS4Device(1)
+    buf = device.buf
+    buf[5] = 8
+
+    reports = []
+    for i in range(count):
+        for offset in (1, 2, 3, 4):
+            buf[offset] = 128 + rand.randint(-STICK_JITTER, STICK_JITTER)
+
+        MOTION.pack_into(buf, 13, *(rand.randint(-MOTION_NOISE, MOTION_NOISE)
+                                    for axis in range(6)))
+        reports.append(device.parse_report(buf))
+
+    return reports
+
+
+def time_emit(emit, reports, rounds):
+    """Returns the fastest time per report of rounds runs over reports."""
+    best = None
+    for i in range(rounds):
+        start = perf_counter()
+        for report in reports:
+            emit(report)
+        elapsed = (perf_counter() - start) / len(reports)
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def benchmark(mapping, reports, rounds):
+    device = create_uinput_device(mapping, sink=NullSink)
+    moving = time_emit(device.emit, reports, rounds)
+    events = device.events_written / (len(reports) * rounds)
+
+    idle = time_emit(device.emit, [reports[-1]] * len(reports), rounds)
+
+    mouse = None
+    if device.layout.mouse:
+        emit_mouse = lambda report: device.emit_mouse(report, MOUSE_INTERVAL)
+        mouse = time_emit(emit_mouse, reports, rounds)
+
+    device.close()
+    return moving, idle, events, mouse
+
+
+def benchmark_hysteresis(mapping, threshold, reports, rounds):
+    """Returns events and suppressed events per report and the time per
+    report of emitting reports, with threshold 0 the filter is off."""
+    device = create_uinput_device(mapping, sink=NullSink)
+    if threshold:
+        thresholds = dict((attr, threshold)
+                          for attrs in FILTER_GROUPS.values()
+                          for attr in attrs)
+        device.layout = device.layout._replace(hysteresis=thresholds)
+        device.compile_emit_plan()
+
+    device.emit(reports[-1])
+    device.events_written = device.events_suppressed = 0
+
+    elapsed = time_emit(device.emit, reports, rounds)
+    count = len(reports) * rounds
+    events = device.events_written / count
+    suppressed = device.events_suppressed / count
+
+    device.close()
+    return events, suppressed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="emitbench",
+                                     description=__doc__.split("\n")[0])
+    parser.add_argument("--mappings", default=",".join(MAPPINGS),
+                        help="Comma-separated mappings to benchmark")
+    parser.add_argument("--reports", type=int, default=10000,
+                        help="Reports emitted per round")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="Rounds per mapping, the fastest is shown")
+    parser.add_argument("--hysteresis", type=int, default=4,
+                        help="Hysteresis threshold to measure, 0 skips the "
+                             "hysteresis benchmark")
+    parser.add_argument("--hysteresis-mapping", default="ds4",
+                        help="Mapping the hysteresis benchmark uses")
+    parser.add_argument("--rate", type=int, default=250,
+                        help="Reports per second used for events per "
+                             "second, 250 for USB")
+
+    args = parser.parse_args()
+    reports = generate_reports(args.reports)
+
+    row = "{0:<14} {1:>10} {2:>10} {3:>10} {4:>12}"
+    print(row.format("mapping", "emit us", "idle us", "events",
+                     "mouse us"))
+
+    for mapping in filter(None, map(str.strip, args.mappings.split(","))):
+        moving, idle, events, mouse = benchmark(mapping, reports,
+                                                args.rounds)
+        print(row.format(mapping, "{0:.2f}".format(moving * 10**6),
+                         "{0:.2f}".format(idle * 10**6),
+                         "{0:.1f}".format(events),
+                         mouse and "{0:.2f}".format(mouse * 10**6) or "-"))
+
+    if not args.hysteresis:
+        return
+
+    print()
+    print("hysteresis {0} on {1} at {2} reports/s".format(
+        args.hysteresis, args.hysteresis_mapping, args.rate
+    ))
+
+    row = "{0:<8} {1:<8} {2:>10} {3:>12} {4:>10}"
+    print(row.format("capture", "filter", "events/s", "suppressed/s",
+                     "emit us"))
+
+    captures = (("jitter", generate_jitter_reports(args.reports)),
+                ("moving", reports))
+    for capture, capture_reports in captures:
+        for threshold in (0, args.hysteresis):
+            events, suppressed, elapsed = benchmark_hysteresis(
+                args.hysteresis_mapping, threshold, capture_reports,
+                args.rounds
+            )
+            print(row.format(capture, threshold and "on" or "off",
+                             int(events * args.rate),
+                             int(suppressed * args.rate),
+                             "{0:.2f}".format(elapsed * 10**6)))
+
+
+if __name__ == "__main__":
+    main()
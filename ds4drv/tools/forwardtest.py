@@ -0,0 +1,200 @@
+"""Loopback test of controller forwarding under packet loss and reordering.
+
+A synthetic controller is forwarded to an in-process receiver through a
+relay that randomly drops and reorders packets in both directions. Every
+report the receiver produces is checked against the state that was sent
+with the same sequence number, so a delta decoded against the wrong base
+shows up as a mismatch.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import random
+import select
+import socket
+import sys
+
+from operator import attrgetter
+from threading import Thread
+from time import sleep, time
+
+from ..backends.receiver import ReceiverBackend
+from ..device import STATE_NAMES
+from ..logger import Logger
+from ..servers.forward import ForwardServer
+from .dsuload import SyntheticController
+
+
+class LossyRelay(object):
+    """Passes packets between the forwarder and the receiver, dropping
+    and holding back some of them."""
+
+    def __init__(self, receiver_address, loss, reorder, seed=None):
+        self.receiver_address = receiver_address
+        self.loss = loss
+        self.reorder = reorder
+        self.random = random.Random(seed)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = self.sock.getsockname()
+        self.forwarder_address = None
+
+        # A packet held back per direction, sent after the next one
+        self.held = {}
+        self.relayed = 0
+        self.dropped = 0
+        self.reordered = 0
+
+    def relay(self, packet, address):
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            return
+
+        held = self.held.pop(address, None)
+        if held is None and self.random.random() < self.reorder:
+            self.held[address] = packet
+            self.reordered += 1
+            return
+
+        self.sock.sendto(packet, address)
+        if held is not None:
+            self.sock.sendto(held, address)
+
+        self.relayed += 1
+
+    def run(self):
+        while True:
+            packet, address = self.sock.recvfrom(2048)
+            if address == self.receiver_address:
+                if self.forwarder_address:
+                    self.relay(packet, self.forwarder_address)
+            else:
+                self.forwarder_address = address
+                self.relay(packet, self.receiver_address)
+
+    def start(self):
+        thread = Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+
+class Checker(object):
+    """Compares the receiver's reports with the states that were sent."""
+
+    def __init__(self):
+        self.get_state = attrgetter(*STATE_NAMES)
+        self.sent = {}
+        self.checked = 0
+        self.mismatches = 0
+        self.unknown = 0
+
+    def record(self, seq, report):
+        self.sent[seq] = self.get_state(report)
+
+    def check(self, device):
+        while True:
+            buf = device.read_raw_report()
+            if not buf:
+                return
+
+            state = self.sent.get(device.last_seq)
+            if state is None:
+                self.unknown += 1
+                continue
+
+            self.checked += 1
+            if self.get_state(device.parse_report(buf)) != state:
+                self.mismatches += 1
+
+
+def receive_devices(backend, devices):
+    for device in backend.devices:
+        devices.append(device)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="ds4drv-forwardtest",
+                                     description=__doc__.split("\n")[0])
+    parser.add_argument("--duration", type=float, default=5,
+                        help="Seconds to run the test for")
+    parser.add_argument("--rate", type=float, default=250,
+                        help="Reports per second of the synthetic "
+                             "controller")
+    parser.add_argument("--loss", type=float, default=0.1,
+                        help="Fraction of packets to drop")
+    parser.add_argument("--reorder", type=float, default=0.05,
+                        help="Fraction of packets to delay until after "
+                             "the next one")
+    parser.add_argument("--keyframe-interval", type=int, default=250,
+                        help="Reports between keyframes")
+    parser.add_argument("--seed", type=int,
+                        help="Seed of the relay's random loss and "
+                             "reordering")
+
+    args = parser.parse_args()
+    logger = Logger()
+
+    backend = ReceiverBackend(logger, "127.0.0.1", 0)
+    backend.setup()
+
+    relay = LossyRelay(backend.sock.getsockname(), args.loss, args.reorder,
+                       args.seed)
+    relay.start()
+
+    devices = []
+    thread = Thread(target=receive_devices, args=(backend, devices))
+    thread.daemon = True
+    thread.start()
+
+    server = ForwardServer(logger, *relay.address,
+                           keyframe_interval=args.keyframe_interval)
+    controller = SyntheticController(1)
+    server.register_controller(controller)
+    server.start()
+
+    checker = Checker()
+    stream = server.streams[controller.index]
+    controller.loop.register_event(
+        "device-report", lambda report: checker.record(stream.seq, report)
+    )
+
+    interval = 1 / args.rate
+    start = time()
+    frame = 0
+    while time() - start < args.duration:
+        controller.emit()
+        frame += 1
+
+        delay = start + frame * interval - time()
+        for device in devices:
+            if select.select([device.report_fd], [], [], max(0, delay))[0]:
+                checker.check(device)
+
+        delay = start + frame * interval - time()
+        if delay > 0:
+            sleep(delay)
+
+    # Give the last packets time to arrive
+    sleep(0.1)
+    for device in devices:
+        checker.check(device)
+
+    print("sent {0}, relayed {1}, dropped {2}, reordered {3} by the relay"
+          .format(stream.seq, relay.relayed, relay.dropped, relay.reordered))
+
+    for device in devices:
+        print("receiver: {0} received, {1} lost, {2} reordered, {3} "
+              "dropped".format(device.received, device.lost,
+                               device.reordered, device.dropped))
+
+    print("checked {0} reports, {1} mismatches, {2} of unknown sequence"
+          .format(checker.checked, checker.mismatches, checker.unknown))
+
+    if not devices or not checker.checked or checker.mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Allocation and garbage collection benchmark of the report pool.
+
+Synthetic reports are parsed by a device without a pool and with each
+of the given pool sizes. Two passes are made for each:
+
+  parse     Only the last report is kept, like the controller does.
+            Shows the time per report and the collections and pauses of
+            the garbage collector.
+  retain    Every report returned is kept until the pass ends. Shows the
+            memory blocks the parser allocates per report and the
+            collections they cause, which is what a consumer keeping
+            history of unpooled reports pays.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import gc
+import sys
+
+from time import perf_counter
+
+from ..collector import GCStats
+from ..config import intlist
+from ..device import DS4Device
+from .dsuload import SyntheticDS4Device
+
+
+def generate_buffers(count):
+    device = SyntheticDS4Device(1)
+    buffers = []
+    for i in range(count):
+        device.next_report()
+        buffers.append(bytes(device.buf))
+
+    return buffers
+
+
+def create_device(pool):
+    device = DS4Device("poolbench", "00:00:00:00:00:01", "usb")
+    if pool:
+        device.set_report_pool(pool)
+
+    return device
+
+
+def measure(func):
+    """Runs func with fresh collector statistics, returns the stats and
+    the seconds func took."""
+    gc.collect()
+    stats = GCStats()
+    gc.callbacks.append(stats.callback)
+    try:
+        start = perf_counter()
+        func()
+        elapsed = perf_counter() - start
+    finally:
+        gc.callbacks.remove(stats.callback)
+
+    return stats, elapsed
+
+
+def parse_pass(pool, buffers):
+    device = create_device(pool)
+
+    def run():
+        last = None
+        for buf in buffers:
+            last = device.parse_report(buf)
+
+    return measure(run)
+
+
+def retain_pass(pool, buffers):
+    device = create_device(pool)
+
+    # Allocated up front, so only the parser's blocks are counted
+    reports = [None] * len(buffers)
+    blocks = [0]
+
+    def run():
+        before = sys.getallocatedblocks()
+        for i, buf in enumerate(buffers):
+            reports[i] = device.parse_report(buf)
+        blocks[0] = sys.getallocatedblocks() - before
+
+    stats, elapsed = measure(run)
+
+    return stats, blocks[0] / len(buffers)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="poolbench",
+                                     description=__doc__.split("\n")[0])
+    parser.add_argument("--pools", type=intlist, default="0,2,3",
+                        help="Comma-separated pool sizes, 0 is no pool")
+    parser.add_argument("--reports", type=int, default=100000,
+                        help="Reports parsed per pass")
+
+    args = parser.parse_args()
+    buffers = generate_buffers(args.reports)
+
+    row = "{0:>5} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10} {6:>10}"
+    print(row.format("", "", "parse", "", "", "retain", ""))
+    print(row.format("pool", "us", "gen0", "max ms", "blocks",
+                     "gen0", "max ms"))
+
+    for pool in args.pools:
+        parse_stats, elapsed = parse_pass(pool, buffers)
+        retain_stats, blocks = retain_pass(pool, buffers)
+
+        print(row.format(pool or "none",
+                         "{0:.2f}".format(elapsed / len(buffers) * 10**6),
+                         parse_stats.collections[0],
+                         "{0:.2f}".format(parse_stats.pause_max * 1000),
+                         "{0:.2f}".format(blocks),
+                         retain_stats.collections[0],
+                         "{0:.2f}".format(retain_stats.pause_max * 1000)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark of switching between profiles with different layouts.
+
+A controller with a synthetic device cycles through three profiles
+using the ds4, xpad and xboxdrv layouts, once with the joystick device
+recreated on every switch and once with --uinput-pool. Devices write
+to a null sink, so the times show ds4drv's own share of a switch, a
+real uinput device takes longer to create.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import tempfile
+
+from time import perf_counter
+
+from ..daemon import Daemon
+from .dispatchbench import create_controller
+
+CONFIG = """
+[profile:xpad]
+emulate-xpad = true
+
+[profile:xboxdrv]
+emulate-xboxdrv = true
+"""
+
+OPTIONS = ["--uinput-sink", "null", "--profiles", "xpad,xboxdrv"]
+
+
+def benchmark(config, pool, switches):
+    """Returns the time of setting up the controller and of each
+    switch."""
+    args = OPTIONS + (pool and ["--uinput-pool"] or [])
+
+    start = perf_counter()
+    controller = create_controller(args, config)
+    setup = perf_counter() - start
+
+    times = []
+    for i in range(switches):
+        start = perf_counter()
+        controller.next_profile()
+        times.append(perf_counter() - start)
+
+    controller.fire_event("device-cleanup")
+
+    return setup, times
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="profilebench",
+                                     description=__doc__.split("\n")[0])
+    parser.add_argument("--switches", type=int, default=300,
+                        help="Profile switches per run")
+
+    args = parser.parse_args()
+
+    # Every switch is logged, keep the output to the results
+    Daemon.logger.set_level("error")
+
+    with tempfile.NamedTemporaryFile("w", suffix=".conf",
+                                     delete=False) as config:
+        config.write(CONFIG)
+
+    try:
+        results = [(pool, benchmark(config.name, pool, args.switches))
+                   for pool in (False, True)]
+    finally:
+        os.unlink(config.name)
+
+    row = "{0:<8} {1:>10} {2:>10} {3:>10} {4:>10} {5:>10}"
+    print(row.format("pool", "setup ms", "first ms", "avg ms", "p99 ms",
+                     "max ms"))
+
+    for pool, (setup, times) in results:
+        print(row.format(pool and "on" or "off",
+                         "{0:.3f}".format(setup * 1000),
+                         "{0:.3f}".format(times[0] * 1000),
+                         "{0:.3f}".format(sum(times) / len(times) * 1000),
+                         "{0:.3f}".format(percentile(times, 0.99) * 1000),
+                         "{0:.3f}".format(max(times) * 1000)))
+
+
+if __name__ == "__main__":
+    main()
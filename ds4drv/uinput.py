@@ -1,11 +1,19 @@
+from __future__ import division
+
+import math
+import os
 import os.path
 import time
 
+from array import array
 from collections import namedtuple
+from operator import attrgetter
+from struct import Struct
 
 from evdev import UInput, UInputError, ecodes
 from evdev import util
 
+from .device import TOUCH_SAMPLE_SIZE, touch_sample_index
 from .exceptions import DeviceError
 
 # Check for the existence of a "resolve_ecodes_dict" function.
@@ -22,10 +30,52 @@ DEFAULT_MOUSE_DEADZONE = 5
 DEFAULT_SCROLL_REPEAT_DELAY = .250 # Seconds to wait before continual scrolling
 DEFAULT_SCROLL_DELAY = .035        # Seconds to wait between scroll events
 
+# Stick to mouse speeds are relative to this interval in seconds
+MOUSE_INTERVAL = 0.005
+
+# The DS4 sensor clock ticks every 16/3 microseconds
+SENSOR_CLOCK_NUM = 16
+SENSOR_CLOCK_DEN = 3
+
+# Last written value of a code that has not been written yet
+NOT_WRITTEN = -2 ** 31
+
+# struct input_event, the kernel fills in the time of events written
+# to uinput so it is left as zero
+INPUT_EVENT = Struct("llHHi")
+
+# Recordings are the magic followed by a RECORD_HEADER (monotonic time in
+# nanoseconds, event count) and the events as RECORD_EVENT per write
+RECORDING_MAGIC = b"DS4UREC1"
+RECORD_HEADER = Struct("<QH")
+RECORD_EVENT = Struct("<HHi")
+
+# Report attributes each response curve in a mapping applies to
+CURVE_GROUPS = {
+    "LEFT_STICK": ("left_analog_x", "left_analog_y"),
+    "RIGHT_STICK": ("right_analog_x", "right_analog_y"),
+    "L2": ("l2_analog",),
+    "R2": ("r2_analog",),
+}
+CURVE_OPTIONS = ("ANTI_DEADZONE", "CURVE", "DEADZONE", "DEADZONE_TYPE",
+                 "SATURATION")
+DEADZONE_TYPES = ("axial", "radial")
+
+# Report attributes each hysteresis threshold in a mapping applies to
+FILTER_GROUPS = dict(CURVE_GROUPS, **{
+    "MOTION": ("motion_x", "motion_y", "motion_z"),
+    "ORIENTATION": ("orientation_roll", "orientation_yaw",
+                    "orientation_pitch"),
+})
+
 UInputMapping = namedtuple("UInputMapping",
                            "name bustype vendor product version "
                            "axes axes_options buttons hats keys mouse "
-                           "mouse_options")
+                           "mouse_options curves hysteresis input_props")
+
+ResponseCurve = namedtuple("ResponseCurve",
+                           "deadzone radial anti_deadzone exponent "
+                           "saturation")
 
 _mappings = {}
 
@@ -44,18 +94,139 @@ def parse_button(attr):
     return (attr, modifier)
 
 
+def parse_curve(group, options):
+    """Parses the response curve options of a curve group."""
+    try:
+        curve = ResponseCurve(
+            deadzone=float(options.get("DEADZONE", 0)),
+            radial=options.get("DEADZONE_TYPE", "axial").lower(),
+            anti_deadzone=float(options.get("ANTI_DEADZONE", 0)),
+            exponent=float(options.get("CURVE", 1)),
+            saturation=float(options.get("SATURATION", 1)),
+        )
+    except ValueError as err:
+        raise ValueError("Invalid {0} curve: {1}".format(group.lower(), err))
+
+    if curve.radial not in DEADZONE_TYPES:
+        raise ValueError("Invalid {0} deadzone type: {1}".format(
+            group.lower(), curve.radial
+        ))
+
+    if not 0 <= curve.deadzone < curve.saturation <= 1:
+        raise ValueError("Invalid {0} curve: deadzone and saturation must "
+                         "be between 0 and 1".format(group.lower()))
+
+    if not 0 <= curve.anti_deadzone < 1:
+        raise ValueError("Invalid {0} curve: anti deadzone must be at least "
+                         "0 and below 1".format(group.lower()))
+
+    if not curve.exponent > 0:
+        raise ValueError("Invalid {0} curve: curve must be above "
+                         "0".format(group.lower()))
+
+    return curve._replace(radial=curve.radial == "radial")
+
+
+def response(curve, magnitude):
+    """Maps a magnitude between 0 and 1 through a response curve."""
+    if magnitude <= curve.deadzone:
+        return 0.0
+
+    value = min((magnitude - curve.deadzone) /
+                (curve.saturation - curve.deadzone), 1.0)
+    value **= curve.exponent
+
+    return curve.anti_deadzone + (1 - curve.anti_deadzone) * value
+
+
+def stick_to_unit(value):
+    return (value - 128) / (127 if value >= 128 else 128)
+
+
+def unit_to_stick(value):
+    value = 128 + int(round(value * (127 if value >= 0 else 128)))
+    return max(0, min(255, value))
+
+
+def compile_curve(group, curve):
+    """Compiles a response curve into lookup tables.
+
+    Returns a dict of attribute -> (table, attrs). The table is indexed
+    by the raw value of the single attribute in attrs, or for radial
+    deadzones by the first attribute shifted left by 8 bits ORed with
+    the second one.
+    """
+    attrs = CURVE_GROUPS[group]
+
+    if len(attrs) == 1:
+        table = bytes(bytearray(
+            int(round(response(curve, value / 255) * 255))
+            for value in range(256)
+        ))
+        return {attrs[0]: (table, attrs)}
+
+    if not curve.radial:
+        table = bytearray()
+        for value in range(256):
+            unit = stick_to_unit(value)
+            table.append(unit_to_stick(
+                math.copysign(response(curve, abs(unit)), unit)
+            ))
+
+        table = bytes(table)
+        return dict((attr, (table, (attr,))) for attr in attrs)
+
+    # Radial deadzones depend on both axes of the stick
+    units = [stick_to_unit(value) for value in range(256)]
+    table_x, table_y = bytearray(65536), bytearray(65536)
+    for x in range(256):
+        unit_x = units[x]
+        for y in range(256):
+            unit_y = units[y]
+            magnitude = math.hypot(unit_x, unit_y)
+            if magnitude:
+                scale = response(curve, min(magnitude, 1.0)) / magnitude
+            else:
+                scale = 0
+
+            table_x[x << 8 | y] = unit_to_stick(unit_x * scale)
+            table_y[x << 8 | y] = unit_to_stick(unit_y * scale)
+
+    return {attrs[0]: (bytes(table_x), attrs),
+            attrs[1]: (bytes(table_y), attrs)}
+
+
 def create_mapping(name, description, bustype=0, vendor=0, product=0,
                    version=0, axes={}, axes_options={}, buttons={},
-                   hats={}, keys={}, mouse={}, mouse_options={}):
+                   hats={}, keys={}, mouse={}, mouse_options={},
+                   curves={}, hysteresis={}, input_props=()):
     axes = {getattr(ecodes, k): v for k,v in axes.items()}
     axes_options = {getattr(ecodes, k): v for k,v in axes_options.items()}
     buttons = {getattr(ecodes, k): parse_button(v) for k,v in buttons.items()}
     hats = {getattr(ecodes, k): v for k,v in hats.items()}
     mouse = {getattr(ecodes, k): parse_button(v) for k,v in mouse.items()}
 
+    tables = {}
+    for group, options in curves.items():
+        tables.update(compile_curve(group, parse_curve(group, options)))
+
+    thresholds = {}
+    for group, threshold in hysteresis.items():
+        try:
+            threshold = int(threshold)
+        except ValueError:
+            raise ValueError("Invalid {0} hysteresis: {1}".format(
+                group.lower(), threshold
+            ))
+
+        if threshold > 1:
+            for attr in FILTER_GROUPS[group]:
+                thresholds[attr] = threshold
+
     mapping = UInputMapping(description, bustype, vendor, product, version,
                             axes, axes_options, buttons, hats, keys, mouse,
-                            mouse_options)
+                            mouse_options, tables, thresholds,
+                            tuple(getattr(ecodes, k) for k in input_props))
     _mappings[name] = mapping
 
 
@@ -220,6 +391,60 @@ create_mapping(
     },
 )
 
+create_mapping(
+    "ds4_motion", "Sony Computer Entertainment Wireless Controller "
+                  "Motion Sensors",
+    ecodes.BUS_USB, 1356, 1476, 273,
+    # Accelerometer and gyroscope, (value, min, max, fuzz, flat, resolution)
+    axes={
+        "ABS_X":  "orientation_roll",
+        "ABS_Y":  "orientation_yaw",
+        "ABS_Z":  "orientation_pitch",
+        "ABS_RX": "motion_y",
+        "ABS_RY": "motion_x",
+        "ABS_RZ": "motion_z",
+    },
+    axes_options={
+        "ABS_X":  (0, -32768, 32767, 0, 0, 8192),
+        "ABS_Y":  (0, -32768, 32767, 0, 0, 8192),
+        "ABS_Z":  (0, -32768, 32767, 0, 0, 8192),
+        "ABS_RX": (0, -32768, 32767, 0, 0, 16),
+        "ABS_RY": (0, -32768, 32767, 0, 0, 16),
+        "ABS_RZ": (0, -32768, 32767, 0, 0, 16),
+    },
+    input_props=["INPUT_PROP_ACCELEROMETER"],
+)
+
+create_mapping(
+    "ds4_trackpad", "Sony Computer Entertainment Wireless Controller "
+                    "Touchpad",
+    ecodes.BUS_USB, 1356, 1476, 273,
+    # Emitted by UInputTrackpad from the touch samples of each report
+    axes={
+        "ABS_X":              "trackpad_touch0_x",
+        "ABS_Y":              "trackpad_touch0_y",
+        "ABS_MT_SLOT":        "trackpad_touch0_id",
+        "ABS_MT_TRACKING_ID": "trackpad_touch0_id",
+        "ABS_MT_POSITION_X":  "trackpad_touch0_x",
+        "ABS_MT_POSITION_Y":  "trackpad_touch0_y",
+    },
+    axes_options={
+        "ABS_X":              (0, 0, 1919, 0, 0, 44),
+        "ABS_Y":              (0, 0, 942, 0, 0, 44),
+        "ABS_MT_SLOT":        (0, 0, 1, 0, 0),
+        "ABS_MT_TRACKING_ID": (0, 0, 65535, 0, 0),
+        "ABS_MT_POSITION_X":  (0, 0, 1919, 0, 0, 44),
+        "ABS_MT_POSITION_Y":  (0, 0, 942, 0, 0, 44),
+    },
+    buttons={
+        "BTN_LEFT":           "button_trackpad",
+        "BTN_TOUCH":          "trackpad_touch0_active",
+        "BTN_TOOL_FINGER":    "trackpad_touch0_active",
+        "BTN_TOOL_DOUBLETAP": "trackpad_touch1_active",
+    },
+    input_props=["INPUT_PROP_POINTER", "INPUT_PROP_BUTTONPAD"],
+)
+
 create_mapping(
     "mouse", "DualShock4 Mouse Emulation",
     buttons={
@@ -232,19 +457,197 @@ create_mapping(
 )
 
 
+def analog_threshold(modifier):
+    """Returns a lookup table turning an analog value into a button state."""
+    if modifier == "+":
+        return tuple(value > (128 + DEFAULT_A2D_DEADZONE)
+                     for value in range(256))
+    else:
+        return tuple(value < (128 - DEFAULT_A2D_DEADZONE)
+                     for value in range(256))
+
+
+def curve_source(curves, attr, index):
+    """Returns (index, convert) reading attr through its response curve.
+
+    index registers a attribute with the emit getter and returns its
+    position in the fetched values, see UInputDevice.compile_emit_plan.
+    """
+    if attr not in curves:
+        return index(attr), None
+
+    table, attrs = curves[attr]
+    if len(attrs) == 1:
+        return index(attr), table.__getitem__
+
+    x, y = index(attrs[0]), index(attrs[1])
+
+    def convert(values):
+        return table[values[x] << 8 | values[y]]
+
+    return None, convert
+
+
+def curve_getter(curves, attr):
+    """Returns a function reading attr through its response curve from
+    a report."""
+    if attr not in curves:
+        return attrgetter(attr)
+
+    table, attrs = curves[attr]
+    if len(attrs) == 1:
+        getter = attrgetter(attr)
+        return lambda report: table[getter(report)]
+
+    getter = attrgetter(*attrs)
+
+    def get(report):
+        x, y = getter(report)
+        return table[x << 8 | y]
+
+    return get
+
+
+def hat_converter(negative, positive):
+    def convert(values):
+        if values[negative]:
+            return -1
+        elif values[positive]:
+            return 1
+        else:
+            return 0
+
+    return convert
+
+
+def released(values):
+    return False
+
+
+class UInputSink(object):
+    """Writes events to a uinput device."""
+
+    def __init__(self, layout, events):
+        # Only passed when needed, python-evdev < 1.0 doesn't support it
+        kwargs = {}
+        if layout.input_props:
+            kwargs["input_props"] = layout.input_props
+
+        self.device = UInput(name=layout.name, events=events,
+                             bustype=layout.bustype, vendor=layout.vendor,
+                             product=layout.product, version=layout.version,
+                             **kwargs)
+
+    @property
+    def evdev_path(self):
+        device = self.device.device
+        if device:
+            return getattr(device, "path", None) or device.fn
+
+    def write(self, data):
+        os.write(self.device.fd, data)
+
+    def close(self):
+        self.device.close()
+
+
+class NullSink(object):
+    """Discards events, only counting writes and events."""
+
+    evdev_path = None
+
+    def __init__(self, layout, events):
+        self.writes = 0
+        self.events = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.events += len(data) // INPUT_EVENT.size
+
+    def close(self):
+        pass
+
+
+class RecordingSink(object):
+    """Records events to a file, see read_recording."""
+
+    evdev_path = None
+
+    def __init__(self, path, layout, events):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_MAGIC)
+
+    def write(self, data):
+        count = len(data) // INPUT_EVENT.size
+        record = bytearray(RECORD_HEADER.pack(int(time.monotonic() * 10**9),
+                                              count))
+        for i in range(count):
+            sec, usec, etype, code, value = INPUT_EVENT.unpack_from(
+                data, i * INPUT_EVENT.size
+            )
+            record.extend(RECORD_EVENT.pack(etype, code, value))
+
+        self.file.write(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_recording(path):
+    """Yields (timestamp, events) for each write in a recording, events
+    is a list of (type, code, value)."""
+    with open(path, "rb") as fp:
+        if fp.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError("Not a uinput recording: {0}".format(path))
+
+        while True:
+            header = fp.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            timestamp, count = RECORD_HEADER.unpack(header)
+            data = fp.read(count * RECORD_EVENT.size)
+            events = [RECORD_EVENT.unpack_from(data, i * RECORD_EVENT.size)
+                      for i in range(len(data) // RECORD_EVENT.size)]
+
+            yield timestamp / 10**9, events
+
+
 class UInputDevice(object):
-    def __init__(self, layout):
+    def __init__(self, layout, timestamps=False, sink=UInputSink):
         self.joystick_dev = None
         self.evdev_dev = None
-        self.ignored_buttons = set()
-        self.create_device(layout)
+        self.timestamps = timestamps
+        self._sensor_last = None
+        self._sensor_ticks = 0
+        self._ignored_buttons = frozenset()
+        self.events_written = 0
+        self.events_suppressed = 0
+        self.create_device(layout, sink)
 
-        self._write_cache = {}
         self._scroll_details = {}
+        self.compile_emit_plan()
         self.emit_reset()
 
-    def create_device(self, layout):
-        """Creates a uinput device using the specified layout."""
+    @property
+    def ignored_buttons(self):
+        return self._ignored_buttons
+
+    @ignored_buttons.setter
+    def ignored_buttons(self, buttons):
+        buttons = frozenset(buttons)
+        if buttons != self._ignored_buttons:
+            self._ignored_buttons = buttons
+            self.compile_emit_plan()
+
+    def create_device(self, layout, sink=UInputSink):
+        """Creates a uinput device using the specified layout.
+
+        sink is called with the layout and the supported events and
+        returns the object events are written to.
+        """
         events = {ecodes.EV_ABS: [], ecodes.EV_KEY: [],
                   ecodes.EV_REL: []}
 
@@ -267,9 +670,13 @@ class UInputDevice(object):
         for name in layout.buttons:
             events[ecodes.EV_KEY].append(name)
 
+        if self.timestamps:
+            events[ecodes.EV_MSC] = [ecodes.MSC_TIMESTAMP]
+
         if layout.mouse:
             self.mouse_pos = {}
             self.mouse_rel = {}
+            self.touch_stamps = {}
             self.mouse_analog_sensitivity = float(
                 layout.mouse_options.get("MOUSE_SENSITIVITY",
                                          DEFAULT_MOUSE_SENSITIVTY)
@@ -287,6 +694,32 @@ class UInputDevice(object):
                                          DEFAULT_SCROLL_DELAY)
             )
 
+            # Stick to mouse speed of every stick position and where
+            # trackpad values are found in touch samples
+            self.mouse_axes = {}
+            self.touch_fields = {}
+            for name, (attr, modifier) in layout.mouse.items():
+                if attr.startswith("trackpad_touch"):
+                    touch = attr[:16]
+                    self.touch_fields[name] = (
+                        attrgetter(touch + "id", touch + "active", attr),
+                        touch_sample_index(touch + "id"),
+                        touch_sample_index(touch + "active"),
+                        touch_sample_index(attr)
+                    )
+
+                if "analog" not in attr:
+                    continue
+
+                sign = -1 if modifier == "-" else 1
+                accel = tuple(
+                    sign * (pos - 128) / 10 * self.mouse_analog_sensitivity
+                    if abs(pos - 128) > self.mouse_analog_deadzone else 0.0
+                    for pos in range(256)
+                )
+                self.mouse_axes[name] = (curve_getter(layout.curves, attr),
+                                         accel)
+
             for name in layout.mouse:
                 if name in (ecodes.REL_WHEELUP, ecodes.REL_WHEELDOWN):
                     if ecodes.REL_WHEEL not in events[ecodes.EV_REL]:
@@ -296,52 +729,201 @@ class UInputDevice(object):
                     events[ecodes.EV_REL].append(name)
                 self.mouse_rel[name] = 0.0
 
-        self.device = UInput(name=layout.name, events=events,
-                             bustype=layout.bustype, vendor=layout.vendor,
-                             product=layout.product, version=layout.version)
+        self.sink = sink(layout, events)
         self.layout = layout
 
-    def write_event(self, etype, code, value):
-        """Writes a event to the device, if it has changed."""
-        last_value = self._write_cache.get(code)
-        if last_value != value:
-            self.device.write(etype, code, value)
-            self._write_cache[code] = value
+        # Every code written by emit gets a slot in the last value array
+        codes = ([(ecodes.EV_ABS, name) for name in layout.axes] +
+                 [(ecodes.EV_KEY, name) for name in layout.buttons] +
+                 [(ecodes.EV_ABS, name) for name in layout.hats])
+        self._slots = dict((code, slot) for slot, code in enumerate(codes))
+        self._last_values = array("l", [NOT_WRITTEN] * len(codes))
 
-    def emit(self, report):
-        """Writes axes, buttons and hats with values from the report to
-        the device."""
+        # Events of a report are collected here and written all at once,
+        # room is reserved for every code, the wheel and the SYN_REPORT
+        size = len(codes) + len(layout.mouse) + 2
+        self._events = bytearray(INPUT_EVENT.size * size)
+        self._event_count = 0
+
+    def compile_emit_plan(self):
+        """Compiles the layout into a flat list of events for emit.
+
+        Each entry is (slot, type, code, index, convert). index points
+        into the tuple of report values fetched by a single attrgetter,
+        if it is None convert is called with the whole tuple instead.
+
+        Axes with a hysteresis threshold go into a separate filter plan,
+        its entries additionally hold the threshold and the values that
+        are always written (centre, minimum and maximum).
+        """
+        attrs = []
+
+        def index(attr):
+            if attr not in attrs:
+                attrs.append(attr)
+
+            return attrs.index(attr)
+
+        curves = self.layout.curves
+        plan, filter_plan = [], []
         for name, attr in self.layout.axes.items():
-            value = getattr(report, attr)
-            self.write_event(ecodes.EV_ABS, name, value)
+            entry = ((self._slots[(ecodes.EV_ABS, name)], ecodes.EV_ABS,
+                      name) + curve_source(curves, attr, index))
+
+            threshold = self.layout.hysteresis.get(attr)
+            if threshold:
+                params = self.layout.axes_options.get(name,
+                                                      DEFAULT_AXIS_OPTIONS)
+                # The centre is where a released stick rests, 128 for
+                # 0-255 axes like unit_to_stick(0) gives
+                exact = frozenset((params[1], (params[1] + params[2] + 1) // 2,
+                                   params[2]))
+                filter_plan.append(entry + (threshold, exact))
+            else:
+                plan.append(entry)
 
-        for name, attr in self.layout.buttons.items():
-            attr, modifier = attr
+        for name, (attr, modifier) in self.layout.buttons.items():
+            slot = self._slots[(ecodes.EV_KEY, name)]
 
             if attr in self.ignored_buttons:
-                value = False
+                plan.append((slot, ecodes.EV_KEY, name, None, released))
+            elif modifier and "analog" in attr:
+                table = analog_threshold(modifier)
+                source, curve = curve_source(curves, attr, index)
+                if source is None:
+                    def convert(values, curve=curve, table=table):
+                        return table[curve(values)]
+                elif curve:
+                    table = tuple(table[curve(value)] for value in range(256))
+                    convert = table.__getitem__
+                else:
+                    convert = table.__getitem__
+
+                plan.append((slot, ecodes.EV_KEY, name, source, convert))
             else:
-                value = getattr(report, attr)
+                plan.append((slot, ecodes.EV_KEY, name, index(attr), None))
+
+        for name, (negative, positive) in self.layout.hats.items():
+            convert = hat_converter(index(negative), index(positive))
+            plan.append((self._slots[(ecodes.EV_ABS, name)], ecodes.EV_ABS,
+                         name, None, convert))
+
+        if len(attrs) > 1:
+            self._emit_getter = attrgetter(*attrs)
+        elif attrs:
+            getter = attrgetter(attrs[0])
+            self._emit_getter = lambda report: (getter(report),)
+        else:
+            self._emit_getter = lambda report: ()
+
+        self._emit_plan = tuple(plan)
+        self._filter_plan = tuple(filter_plan)
+
+    def queue_event(self, etype, code, value):
+        """Adds a event to the buffer written by flush."""
+        offset = self._event_count * INPUT_EVENT.size
+        if offset >= len(self._events):
+            self._events.extend(bytearray(INPUT_EVENT.size * 8))
+
+        INPUT_EVENT.pack_into(self._events, offset, 0, 0, etype, code, value)
+        self._event_count += 1
+
+    def flush(self):
+        """Writes the queued events followed by a SYN_REPORT in a single
+        write, nothing is written if no events are queued."""
+        if not self._event_count:
+            return
+
+        self.events_written += self._event_count
+        self.queue_event(ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+        size = self._event_count * INPUT_EVENT.size
+        self._event_count = 0
+
+        self.sink.write(memoryview(self._events)[:size])
+
+    @property
+    def evdev_path(self):
+        """Path of the evdev node, None if not known."""
+        return self.sink.evdev_path
+
+    def close(self):
+        self.sink.close()
 
-            if modifier and "analog" in attr:
-                if modifier == "+":
-                    value = value > (128 + DEFAULT_A2D_DEADZONE)
-                elif modifier == "-":
-                    value = value < (128 - DEFAULT_A2D_DEADZONE)
+    def write_event(self, etype, code, value):
+        """Queues a event for the device, if it has changed."""
+        slot = self._slots[(etype, code)]
+        if self._last_values[slot] != value:
+            self.queue_event(etype, code, value)
+            self._last_values[slot] = value
 
-            self.write_event(ecodes.EV_KEY, name, value)
+    def emit(self, report):
+        """Writes axes, buttons and hats with values from the report to
+        the device."""
+        values = self._emit_getter(report)
+        last_values = self._last_values
+        queue_event = self.queue_event
 
-        for name, attr in self.layout.hats.items():
-            if getattr(report, attr[0]):
-                value = -1
-            elif getattr(report, attr[1]):
-                value = 1
+        for slot, etype, code, index, convert in self._emit_plan:
+            if index is None:
+                value = convert(values)
+            else:
+                value = values[index]
+                if convert is not None:
+                    value = convert(value)
+
+            if last_values[slot] != value:
+                queue_event(etype, code, value)
+                last_values[slot] = value
+
+        for (slot, etype, code, index, convert,
+             threshold, exact) in self._filter_plan:
+            if index is None:
+                value = convert(values)
             else:
-                value = 0
+                value = values[index]
+                if convert is not None:
+                    value = convert(value)
+
+            last = last_values[slot]
+            if last == value:
+                continue
+
+            # Small changes are noise, unless they reach a value that
+            # has to be exact
+            if abs(value - last) < threshold and value not in exact:
+                self.events_suppressed += 1
+                continue
+
+            queue_event(etype, code, value)
+            last_values[slot] = value
 
-            self.write_event(ecodes.EV_ABS, name, value)
+        if self.timestamps:
+            timestamp = self.sensor_time(report.sensor_timestamp)
+            if self._event_count:
+                queue_event(ecodes.EV_MSC, ecodes.MSC_TIMESTAMP, timestamp)
 
-        self.device.syn()
+        self.flush()
+
+    def sensor_time(self, ticks):
+        """Unwraps the 16-bit sensor clock of a report into a
+        MSC_TIMESTAMP value in microseconds.
+
+        Must be called with every report, the clock wraps around about
+        every 350 ms.
+        """
+        if self._sensor_last is not None:
+            self._sensor_ticks += (ticks - self._sensor_last) & 0xffff
+        self._sensor_last = ticks
+
+        value = (self._sensor_ticks * SENSOR_CLOCK_NUM //
+                 SENSOR_CLOCK_DEN) & 0xffffffff
+
+        # The kernel treats the value as a wrapping unsigned 32-bit
+        # counter, but events carry it in a signed int
+        if value > 0x7fffffff:
+            value -= 0x100000000
+
+        return value
 
     def emit_reset(self):
         """Resets the device to a blank state."""
@@ -355,50 +937,44 @@ class UInputDevice(object):
         for name in self.layout.hats:
             self.write_event(ecodes.EV_ABS, name, 0)
 
-        self.device.syn()
+        self.flush()
+
+    def emit_mouse(self, report, elapsed=MOUSE_INTERVAL):
+        """Calculates relative mouse values from a report and writes them.
+
+        Stick movement is scaled by the seconds elapsed since the last
+        call. Returns True while a stick is outside of the deadzone or a
+        scroll button is held, i.e. when calling again later would move
+        the mouse even without a new report.
+        """
+        scale = elapsed / MOUSE_INTERVAL
+        pending = False
 
-    def emit_mouse(self, report):
-        """Calculates relative mouse values from a report and writes them."""
         for name, attr in self.layout.mouse.items():
             # If the attr is a tuple like (left_analog_y, "-")
             # then set the attr to just be the first item
             attr, modifier = attr
 
             if attr.startswith("trackpad_touch"):
-                active_attr = attr[:16] + "active"
-                if not getattr(report, active_attr):
-                    self.mouse_pos.pop(name, None)
-                    continue
-
-                pos = getattr(report, attr)
-                if name not in self.mouse_pos:
-                    self.mouse_pos[name] = pos
-
                 sensitivity = 0.5
-                self.mouse_rel[name] += (pos - self.mouse_pos[name]) * sensitivity
-                self.mouse_pos[name] = pos
-
-            elif "analog" in attr:
-                pos = getattr(report, attr)
-                if (pos > (128 + self.mouse_analog_deadzone)
-                    or pos < (128 - self.mouse_analog_deadzone)):
-                    accel = (pos - 128) / 10
-                else:
-                    continue
+                self.mouse_rel[name] += (self.touch_motion(name, report) *
+                                         sensitivity)
 
-                # If a minus modifier has been given then minus the acceleration
-                # to invert the direction.
-                if (modifier and modifier == "-"):
-                    accel = -accel
+            elif name in self.mouse_axes:
+                getter, accel = self.mouse_axes[name]
+                accel = accel[getter(report)]
+                if not accel:
+                    continue
 
-                sensitivity = self.mouse_analog_sensitivity
-                self.mouse_rel[name] += accel * sensitivity
+                self.mouse_rel[name] += accel * scale
+                pending = True
 
             # Emulate mouse wheel (needs special handling)
             if name in (ecodes.REL_WHEELUP, ecodes.REL_WHEELDOWN):
                 ecode = ecodes.REL_WHEEL # The real event we need to emit
                 write = False
                 if getattr(report, attr):
+                    pending = True
                     self._scroll_details['direction'] = name
                     now = time.time()
                     last_write = self._scroll_details.get('last_write')
@@ -418,7 +994,7 @@ class UInputDevice(object):
                         elif now - last_write > self.scroll_repeat_delay:
                             write = True
                     if write:
-                        self.device.write(ecodes.EV_REL, ecode, value)
+                        self.queue_event(ecodes.EV_REL, ecode, value)
                         self._scroll_details['last_write'] = now
                         self._scroll_details['count'] += 1
                         continue # No need to proceed further
@@ -429,34 +1005,230 @@ class UInputDevice(object):
                         self._scroll_details['count'] = 0
 
             rel = int(self.mouse_rel[name])
-            self.mouse_rel[name] = self.mouse_rel[name] - rel
-            self.device.write(ecodes.EV_REL, name, rel)
+            if rel:
+                self.mouse_rel[name] = self.mouse_rel[name] - rel
+                self.queue_event(ecodes.EV_REL, name, rel)
+
+        self.flush()
+
+        return pending
+
+
+    def touch_motion(self, name, report):
+        """Returns how far the touch of a trackpad mouse code moved since
+        the last call, going through every touch sample of the report.
+
+        Samples already seen in a earlier call are skipped, so calling
+        this repeatedly with the same report gives no motion.
+        """
+        getter, id_index, active_index, value_index = self.touch_fields[name]
+        samples = report.touch_samples
+
+        if samples:
+            stamps = samples[::TOUCH_SAMPLE_SIZE]
+            touches = zip(samples[id_index::TOUCH_SAMPLE_SIZE],
+                          samples[active_index::TOUCH_SAMPLE_SIZE],
+                          samples[value_index::TOUCH_SAMPLE_SIZE])
+
+            last_stamp = self.touch_stamps.get(name)
+            if last_stamp in stamps:
+                start = len(stamps) - stamps[::-1].index(last_stamp)
+                touches = list(touches)[start:]
+
+            self.touch_stamps[name] = stamps[-1]
+        else:
+            # Reports without trackpad packets still carry the touches
+            touches = (getter(report),)
+
+        delta = 0
+        last = self.mouse_pos.get(name)
+        for touch_id, active, value in touches:
+            if not active:
+                last = None
+                continue
+
+            # A new finger starts from where it was put down
+            if last and last[0] == touch_id:
+                delta += value - last[1]
+
+            last = (touch_id, value)
+
+        if last:
+            self.mouse_pos[name] = last
+        else:
+            self.mouse_pos.pop(name, None)
+
+        return delta
+
+
+class UInputTrackpad(UInputDevice):
+    """A multitouch touchpad fed with every touch sample of a report.
 
-        self.device.syn()
+    Each sample becomes its own frame of slot and position events, all
+    frames of a report are written at once.
+    """
 
+    def __init__(self, layout, timestamps=False, sink=UInputSink):
+        self.contacts = [None, None]
+        self.mt_slot = None
+        self.touch_stamp = None
 
-def create_uinput_device(mapping):
-    """Creates a uinput device."""
+        super(UInputTrackpad, self).__init__(layout, False, sink)
+
+    def emit(self, report):
+        samples = report.touch_samples
+        if samples:
+            frames = [samples[i:i + TOUCH_SAMPLE_SIZE]
+                      for i in range(0, len(samples), TOUCH_SAMPLE_SIZE)]
+
+            # Skip samples already written with a earlier report
+            stamps = [frame[0] for frame in frames]
+            if self.touch_stamp in stamps:
+                start = len(stamps) - stamps[::-1].index(self.touch_stamp)
+                frames = frames[start:]
+
+            self.touch_stamp = stamps[-1]
+        else:
+            frames = [(None,
+                       report.trackpad_touch0_id,
+                       report.trackpad_touch0_active,
+                       report.trackpad_touch0_x, report.trackpad_touch0_y,
+                       report.trackpad_touch1_id,
+                       report.trackpad_touch1_active,
+                       report.trackpad_touch1_x, report.trackpad_touch1_y)]
+
+        for frame in frames:
+            # Frames are separated by a SYN_REPORT, which is taken back
+            # when the frame adds no events. The last frame is
+            # terminated by flush
+            queued = self._event_count
+            if queued:
+                self.queue_event(ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+
+            self.queue_frame(frame, report.button_trackpad)
+
+            if queued and self._event_count == queued + 1:
+                self._event_count = queued
+
+        if not frames:
+            self.write_event(ecodes.EV_KEY, ecodes.BTN_LEFT,
+                             report.button_trackpad)
+
+        self.flush()
+
+    def select_slot(self, slot):
+        if self.mt_slot != slot:
+            self.queue_event(ecodes.EV_ABS, ecodes.ABS_MT_SLOT, slot)
+            self.mt_slot = slot
+
+    def queue_frame(self, sample, button):
+        """Queues the events of a touch sample, see TOUCH_SAMPLE_FIELDS."""
+        pointer = None
+        fingers = 0
+
+        for slot in (0, 1):
+            touch_id, active, x, y = sample[1 + slot * 4:5 + slot * 4]
+            contact = self.contacts[slot]
+
+            if not active:
+                if contact:
+                    self.select_slot(slot)
+                    self.queue_event(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID,
+                                     -1)
+                    self.contacts[slot] = None
+                continue
+
+            fingers += 1
+            if not contact or contact[0] != touch_id:
+                self.select_slot(slot)
+                self.queue_event(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID,
+                                 touch_id)
+                contact = (touch_id, None, None)
+
+            if contact[1] != x:
+                self.select_slot(slot)
+                self.queue_event(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_X, x)
+
+            if contact[2] != y:
+                self.select_slot(slot)
+                self.queue_event(ecodes.EV_ABS, ecodes.ABS_MT_POSITION_Y, y)
+
+            self.contacts[slot] = (touch_id, x, y)
+            if pointer is None:
+                pointer = (x, y)
+
+        self.write_event(ecodes.EV_KEY, ecodes.BTN_TOUCH, fingers > 0)
+        self.write_event(ecodes.EV_KEY, ecodes.BTN_TOOL_FINGER, fingers == 1)
+        self.write_event(ecodes.EV_KEY, ecodes.BTN_TOOL_DOUBLETAP,
+                         fingers == 2)
+        self.write_event(ecodes.EV_KEY, ecodes.BTN_LEFT, button)
+
+        if pointer:
+            self.write_event(ecodes.EV_ABS, ecodes.ABS_X, pointer[0])
+            self.write_event(ecodes.EV_ABS, ecodes.ABS_Y, pointer[1])
+
+    def emit_reset(self):
+        """Lifts all fingers and releases the button."""
+        for slot, contact in enumerate(self.contacts):
+            if contact:
+                self.select_slot(slot)
+                self.queue_event(ecodes.EV_ABS, ecodes.ABS_MT_TRACKING_ID, -1)
+                self.contacts[slot] = None
+
+        for name in self.layout.buttons:
+            self.write_event(ecodes.EV_KEY, name, False)
+
+        self.flush()
+
+
+def create_uinput_device(mapping, timestamps=False, sink=UInputSink):
+    """Creates a uinput device.
+
+    If timestamps is True the device emits the controller's sensor clock
+    as MSC_TIMESTAMP with every report it writes. sink can be NullSink or
+    a RecordingSink with a path bound to write somewhere else than
+    /dev/uinput.
+    """
     if mapping not in _mappings:
         raise DeviceError("Unknown device mapping: {0}".format(mapping))
 
+    if mapping == "ds4_trackpad":
+        device_class = UInputTrackpad
+    else:
+        device_class = UInputDevice
+
     try:
         mapping = _mappings[mapping]
-        device = UInputDevice(mapping)
-    except UInputError as err:
+        device = device_class(mapping, timestamps, sink)
+    except (IOError, UInputError) as err:
         raise DeviceError(err)
 
     return device
 
 
+def split_group_option(key):
+    """Splits a key like LEFT_STICK_DEADZONE into group and option."""
+    for group in FILTER_GROUPS:
+        if key.startswith(group + "_"):
+            return group, key[len(group) + 1:]
+
+    return None, None
+
+
 def parse_uinput_mapping(name, mapping):
     """Parses a dict of mapping options."""
     axes, buttons, mouse, mouse_options = {}, {}, {}, {}
+    curves, hysteresis = {}, {}
     description = "ds4drv custom mapping ({0})".format(name)
 
     for key, attr in mapping.items():
         key = key.upper()
-        if key.startswith("BTN_") or key.startswith("KEY_"):
+        group, option = split_group_option(key)
+        if group and option == "HYSTERESIS":
+            hysteresis[group] = attr
+        elif group in CURVE_GROUPS and option in CURVE_OPTIONS:
+            curves.setdefault(group, {})[option] = attr
+        elif key.startswith("BTN_") or key.startswith("KEY_"):
             buttons[key] = attr
         elif key.startswith("ABS_"):
             axes[key] = attr
@@ -466,12 +1238,18 @@ def parse_uinput_mapping(name, mapping):
             mouse_options[key] = attr
 
     create_mapping(name, description, axes=axes, buttons=buttons,
-                   mouse=mouse, mouse_options=mouse_options)
+                   mouse=mouse, mouse_options=mouse_options, curves=curves,
+                   hysteresis=hysteresis)
 
 
 def next_joystick_device():
     """Finds the next available js device name."""
+    try:
+        devices = set(os.listdir("/dev/input"))
+    except OSError:
+        devices = set()
+
     for i in range(100):
-        dev = "/dev/input/js{0}".format(i)
-        if not os.path.exists(dev):
-            return dev
+        dev = "js{0}".format(i)
+        if dev not in devices:
+            return os.path.join("/dev/input", dev)
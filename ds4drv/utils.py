@@ -4,6 +4,8 @@ from .device import DS4Report
 
 
 VALID_BUTTONS = DS4Report.__slots__
+VALID_AXES = ("left_analog_x", "left_analog_y", "right_analog_x",
+              "right_analog_y", "l2_analog", "r2_analog")
 
 
 def iter_except(func, exception, first=None):
@@ -38,6 +40,41 @@ def parse_button_combo(combo, sep="+"):
     return tuple(map(button_prefix, combo.lower().split(sep)))
 
 
+def parse_macro(steps):
+    """Parses the steps of a macro section.
+
+    Keys are the time of a step in milliseconds, values a comma-separated
+    list of buttons to hold and axes to set (e.g. 'cross,left_analog_x=0')
+    or 'release'. Returns a list of (seconds, state) sorted by time,
+    where state is a dict of report attributes and their values.
+    """
+    parsed = []
+    for time, step in steps.items():
+        try:
+            time = int(time) / 1000.0
+        except ValueError:
+            raise ValueError("Invalid macro step time: {0}".format(time))
+
+        state = {}
+        for item in step.split(","):
+            item = item.strip()
+            if not item or item == "release":
+                continue
+
+            if "=" in item:
+                axis, value = (part.strip() for part in item.split("=", 1))
+                if axis not in VALID_AXES:
+                    raise ValueError("Invalid axis: {0}".format(axis))
+
+                state[axis] = max(0, min(255, int(value)))
+            else:
+                state[parse_button_combo(item)[0]] = True
+
+        parsed.append((time, state))
+
+    return sorted(parsed, key=lambda step: step[0])
+
+
 def with_metaclass(meta, base=object):
     """Create a base class with a metaclass."""
     return meta("NewBase", (base,), {})
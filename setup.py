@@ -14,13 +14,16 @@ setup(name="ds4drv",
       license="MIT",
       long_description=readme + "\n\n" + history,
       entry_points={
-        "console_scripts": ["ds4drv=ds4drv.__main__:main"]
+        "console_scripts": ["ds4drv=ds4drv.__main__:main",
+                            "ds4drv-dsuload=ds4drv.tools.dsuload:main",
+                            "ds4drv-forwardtest=ds4drv.tools.forwardtest:main"]
       },
       packages=["ds4drv",
                 "ds4drv.actions",
                 "ds4drv.backends",
                 "ds4drv.packages",
-                "ds4drv.servers"],
+                "ds4drv.servers",
+                "ds4drv.tools"],
       install_requires=["evdev>=0.3.0", "pyudev>=0.16"],
       classifiers=[
         "Development Status :: 4 - Beta",